@@ -1,11 +1,18 @@
 import discord
 from discord.ext import commands
+from discord import app_commands
 import os
-from config import DISCORD_TOKEN, BOT_PREFIX, BOT_ACTIVITY, LOG_CHANNEL_ID
+from config import (
+    DISCORD_TOKEN, BOT_PREFIX, BOT_ACTIVITY, LOG_CHANNEL_ID, RECORD_EVENTS_PATH,
+    MESSAGE_CONTENT_INTENT, STANDBY_ENABLED, INSTANCE_ID, LEASE_PATH, LEASE_TTL
+)
+from utils.command_sync import sync_command_tree
+from utils.leader_lease import LeaderLease, StandbyController
+from utils.recorder import EventRecorder
 
 # Define bot intents
 intents = discord.Intents.default()
-intents.message_content = True
+intents.message_content = MESSAGE_CONTENT_INTENT  # Only needed for ! prefix commands
 intents.members = True  # Required for member join/leave events
 intents.guilds = True   # Required for guild operations
 
@@ -13,7 +20,8 @@ intents.guilds = True   # Required for guild operations
 bot = commands.Bot(
     command_prefix=BOT_PREFIX,
     intents=intents,
-    help_command=None  # We'll create custom help if needed
+    help_command=None,  # We'll create custom help if needed
+    enable_debug_events=bool(RECORD_EVENTS_PATH)  # Raw gateway payloads for the event recorder
 )
 
 async def log_to_channel(message: str):
@@ -52,6 +60,13 @@ async def on_ready():
     
     # Load cogs
     await load_cogs()
+    bot.dispatch('cogs_loaded')  # Lets a standby instance start contending for the lease
+    
+    # Register slash commands with Discord if they changed
+    try:
+        await sync_command_tree(bot)
+    except Exception as e:
+        print(f'⚠️ Could not sync slash commands: {e}')
     
     print('✅ Bot is fully ready!')
 
@@ -87,6 +102,18 @@ async def on_command_error(ctx, error):
     print(f'⚠️ {error_message}')
     await log_to_channel(error_message)
     
+    # Slash commands must be answered or Discord shows "The application did not respond"
+    if ctx.interaction:
+        if isinstance(error, commands.CheckFailure):
+            reply = "You can't use this command."
+        else:
+            reply = "Something went wrong while running this command. The error has been logged."
+        try:
+            await ctx.send(reply, ephemeral=True)
+        except:
+            pass
+        return
+    
     # Delete user's command message
     try:
         await ctx.message.delete()
@@ -95,12 +122,16 @@ async def on_command_error(ctx, error):
     
     # Don't send any message to the user
 
-@bot.command(name='reload')
+@bot.hybrid_command(name='reload')
+@app_commands.default_permissions(administrator=True)
 @commands.is_owner()
 async def reload_cogs(ctx):
     """
     Reload all cogs (bot owner only).
     """
+    # Reloading takes longer than the 3s slash command response window
+    await ctx.defer()
+    
     cogs_directory = "cogs"
     reloaded_cogs = []
     failed_cogs = []
@@ -114,6 +145,12 @@ async def reload_cogs(ctx):
             except Exception as e:
                 failed_cogs.append(f'{cog_name}: {e}')
     
+    # Reloaded cogs may have changed their slash commands
+    try:
+        await sync_command_tree(bot)
+    except Exception as e:
+        failed_cogs.append(f'slash command sync: {e}')
+    
     embed = discord.Embed(
         title="🔄 Cogs Reloaded",
         color=discord.Color(int("33D26D", 16))
@@ -136,7 +173,8 @@ async def reload_cogs(ctx):
     
     await ctx.send(embed=embed)
 
-@bot.command(name='status')
+@bot.hybrid_command(name='status')
+@app_commands.default_permissions(administrator=True)
 @commands.has_permissions(administrator=True)
 async def bot_status(ctx):
     """
@@ -153,6 +191,15 @@ async def bot_status(ctx):
     embed.add_field(name="📦 Loaded Cogs", value=str(len(bot.cogs)), inline=True)
     embed.add_field(name="⚡ Uptime", value=f"<t:{int(discord.utils.utcnow().timestamp())}:R>", inline=True)
     
+    welcome_cog = bot.get_cog("Welcome")
+    if welcome_cog:
+        recently_welcomed = welcome_cog.recently_welcomed
+        embed.add_field(
+            name="🔁 Rejoins Suppressed",
+            value=f"{recently_welcomed.suppressed} ({len(recently_welcomed.entries)} tracked)",
+            inline=True
+        )
+    
     await ctx.send(embed=embed)
 
 if __name__ == "__main__":
@@ -161,6 +208,16 @@ if __name__ == "__main__":
         print("❌ Discord token not found! Please set DISCORD_TOKEN in your .env file.")
         exit(1)
     
+    # Record gateway and REST traffic for offline replay
+    recorder = None
+    if RECORD_EVENTS_PATH:
+        recorder = EventRecorder(bot, RECORD_EVENTS_PATH)
+        recorder.install()
+    
+    # Stay passive until this instance holds the shared lease
+    if STANDBY_ENABLED:
+        StandbyController(bot, LeaderLease(LEASE_PATH, INSTANCE_ID, LEASE_TTL)).install()
+    
     # Run the bot
     try:
         bot.run(DISCORD_TOKEN)
@@ -168,3 +225,6 @@ if __name__ == "__main__":
         print("❌ Invalid Discord token! Please check your DISCORD_TOKEN.")
     except Exception as e:
         print(f"❌ Error starting bot: {e}")
+    finally:
+        if recorder:
+            recorder.close()
@@ -1,16 +1,28 @@
 import discord
 from discord.ext import commands
+from discord import app_commands
 from discord.ui import Button, View
 import asyncio
+import os
+import time
+from typing import Literal
 from config import (
     TICKET_CATEGORY_ID, SUPPORT_ROLE_ID, TICKET_OPEN_MESSAGE,
     TICKET_CHANNEL_TOPIC, TICKET_CLOSED_MESSAGE, TICKET_BUTTON_LABEL,
     TICKET_CLOSE_BUTTON_LABEL, TICKET_CLOSE_DELAY, ADMIN_ROLE_ID,
-    CLOSED_TICKET_CATEGORY_ID, LOG_CHANNEL_ID
+    CLOSED_TICKET_CATEGORY_ID, LOG_CHANNEL_ID, TICKET_EVENTS_PATH,
+    TICKET_EVENTS_FLUSH_DELAY
 )
+from utils.ticket_events import (
+    TicketEventLog, TicketLifecycle, SLA_WINDOWS, format_duration
+)
+from utils.clock import loop_clock
+from utils.transcript import TranscriptRenderer
 
 # Track active tickets per user
 active_tickets = {}  # {user_id: channel_id}
+# Ticket channels with a close in progress
+closing_tickets = set()
 
 async def log_to_channel(bot, message: str):
     """Send a log message to the configured log channel."""
@@ -62,6 +74,10 @@ class TicketView(View):
                 # Track active ticket
                 active_tickets[user_id] = ticket_channel.id
                 
+                ticket_cog = self.bot.get_cog("Ticket")
+                if ticket_cog:
+                    ticket_cog.lifecycle.record("opened", ticket_channel.id, user_id)
+                
                 # Log ticket creation
                 await log_to_channel(self.bot, f"Ouverture d'un ticket pour {interaction.user.mention} ({interaction.user.name}) - Canal: {ticket_channel.mention}")
                 
@@ -180,12 +196,30 @@ class TicketCloseView(View):
         """
         Handle the "Close Ticket" button click.
         """
+        # The custom_id is shared by every ticket, so the persistent view registered last may
+        # belong to another channel (e.g. after a standby takeover); act on the clicked one
+        ticket_channel = interaction.channel
+        
+        # A second click during the close delay would archive and move the channel twice
+        if ticket_channel.id in closing_tickets:
+            await interaction.response.send_message("This ticket is already being closed.", ephemeral=True)
+            return
+        closing_tickets.add(ticket_channel.id)
+        try:
+            await self.close_ticket(interaction, ticket_channel)
+        finally:
+            closing_tickets.discard(ticket_channel.id)
+    
+    async def close_ticket(self, interaction, ticket_channel):
+        """
+        Check permissions, archive the transcript and move (or delete) the ticket channel.
+        """
         # Check if user has permission to close ticket (support role or ticket creator)
         member = interaction.user
         has_permission = False
         
         # Check if user is the ticket creator
-        if member in self.channel.overwrites:
+        if member in ticket_channel.overwrites:
             has_permission = True
         
         # Check if user has support role
@@ -209,31 +243,40 @@ class TicketCloseView(View):
         await interaction.response.send_message(TICKET_CLOSED_MESSAGE)
         
         # Log ticket closure
-        await log_to_channel(self.bot, f"Ticket #{self.channel.name} fermé par {interaction.user.mention} ({interaction.user.name})")
+        await log_to_channel(self.bot, f"Ticket #{ticket_channel.name} fermé par {interaction.user.mention} ({interaction.user.name})")
         
         # Wait before moving channel
         await asyncio.sleep(TICKET_CLOSE_DELAY)
         
+        ticket_cog = self.bot.get_cog("Ticket")
+        closed_category = self.bot.get_channel(CLOSED_TICKET_CATEGORY_ID)
+        if ticket_cog:
+            ticket_cog.lifecycle.record("closed", ticket_channel.id, interaction.user.id)
+            if closed_category:
+                # The channel is only moved, so its history can be read in the background
+                ticket_cog.archive_transcript_later(ticket_channel)
+            else:
+                # The channel is deleted below; read its history first
+                await ticket_cog.archive_transcript(ticket_channel)
+        
         try:
             # Remove user from active tickets tracking
             user_id_to_remove = None
             for user_id, channel_id in active_tickets.items():
-                if channel_id == self.channel.id:
+                if channel_id == ticket_channel.id:
                     user_id_to_remove = user_id
                     break
             if user_id_to_remove:
                 del active_tickets[user_id_to_remove]
             
             # Remove user permissions from channel
-            for member, overwrite in self.channel.overwrites.items():
+            for member, overwrite in ticket_channel.overwrites.items():
                 if not isinstance(member, discord.Role) and not member.bot:
-                    await self.channel.set_permissions(member, overwrite=None)
+                    await ticket_channel.set_permissions(member, overwrite=None)
             
-            # Get closed ticket category
-            closed_category = self.bot.get_channel(CLOSED_TICKET_CATEGORY_ID)
             if not closed_category:
                 print(f"Closed ticket category {CLOSED_TICKET_CATEGORY_ID} not found")
-                await self.channel.delete()
+                await ticket_channel.delete()
                 return
             
             # Check if category is full (50 channels max)
@@ -251,19 +294,21 @@ class TicketCloseView(View):
                 
                 if oldest_channel:
                     await oldest_channel.delete()
+                    if ticket_cog:
+                        ticket_cog.lifecycle.record("evicted", oldest_channel.id)
                     print(f"Deleted oldest ticket {oldest_channel.name} to make space")
                     await log_to_channel(self.bot, f"Suppression du plus ancien ticket #{oldest_channel.name} (catégorie pleine)")
             
             # Move channel to closed category
-            await self.channel.edit(category=closed_category)
-            print(f"Moved ticket {self.channel.name} to closed category")
-            await log_to_channel(self.bot, f"Ticket #{self.channel.name} déplacé vers la catégorie fermée")
+            await ticket_channel.edit(category=closed_category)
+            print(f"Moved ticket {ticket_channel.name} to closed category")
+            await log_to_channel(self.bot, f"Ticket #{ticket_channel.name} déplacé vers la catégorie fermée")
             
         except discord.Forbidden:
-            print(f"Missing permissions to move/delete ticket channel {self.channel.name}")
+            print(f"Missing permissions to move/delete ticket channel {ticket_channel.name}")
         except Exception as e:
             print(f"Error handling ticket closure: {e}")
-            await log_to_channel(self.bot, f"Erreur lors de la fermeture du ticket #{self.channel.name}: {e}")
+            await log_to_channel(self.bot, f"Erreur lors de la fermeture du ticket #{ticket_channel.name}: {e}")
 
 class Ticket(commands.Cog):
     """
@@ -272,12 +317,87 @@ class Ticket(commands.Cog):
     
     def __init__(self, bot):
         self.bot = bot
+        self.transcripts = TranscriptRenderer(bot)
+        self.clock = loop_clock()  # Follows virtual time under utils.replay
+        self.archive_tasks = set()  # Store archive tasks so they don't get garbage collected
+        self.lifecycle = TicketLifecycle(TicketEventLog(TICKET_EVENTS_PATH, TICKET_EVENTS_FLUSH_DELAY), self.clock)
+    
+    async def cog_load(self):
+        """Rebuild open tickets and SLA stats from the event log."""
+        await asyncio.to_thread(self.lifecycle.load)
+        # Cogs are loaded from on_ready, so the guild cache is already filled
+        if self.bot.is_ready() and not self.is_passive():
+            self.reconcile_deleted_tickets()
+    
+    async def cog_unload(self):
+        """Stop the transcript worker processes and write pending ticket events."""
+        self.transcripts.close()
+        await self.lifecycle.log.flush()
+    
+    def export_handover(self):
+        """Open ticket tracking, for a standby instance taking over."""
+        return {"active_tickets": [[user_id, channel_id] for user_id, channel_id in active_tickets.items()]}
+    
+    async def import_handover(self, state):
+        """
+        Restore open tickets and apply the events the previous instance logged since our cog_load.
+        """
+        for user_id, channel_id in state.get("active_tickets", []):
+            if self.bot.get_channel(channel_id):
+                active_tickets[user_id] = channel_id
+        
+        # Passive instances don't record events, so the lifecycle is still exactly the log up to its offset
+        await asyncio.to_thread(self.lifecycle.load)
+        self.reconcile_deleted_tickets()
+    
+    def is_passive(self):
+        """True on a standby instance that doesn't hold the lease yet."""
+        standby = getattr(self.bot, "standby", None)
+        return standby is not None and not standby.active
+    
+    def reconcile_deleted_tickets(self):
+        """
+        Record a "deleted" event for open tickets whose channel was deleted while the bot was offline.
+        Needs a filled guild cache.
+        """
+        # An unavailable guild's channels are missing from the cache but not deleted
+        if any(guild.unavailable for guild in self.bot.guilds):
+            return
+        missing = [channel_id for channel_id in self.lifecycle.open if self.bot.get_channel(channel_id) is None]
+        for channel_id in missing:
+            self.lifecycle.record("deleted", channel_id)
+        if missing:
+            print(f"Removed {len(missing)} open tickets whose channel was deleted while offline")
+    
+    async def archive_transcript(self, channel):
+        """
+        Collect the ticket history, then render and upload the transcript in the background.
+        """
+        try:
+            job = await self.transcripts.collect(channel)
+        except Exception as e:
+            print(f"Error collecting transcript for {channel.name}: {e}")
+            await log_to_channel(self.bot, f"Erreur lors de la récupération du transcript de #{channel.name}: {e}")
+            return
+        self.transcripts.publish(job)
+    
+    def archive_transcript_later(self, channel):
+        """
+        Archive a ticket in the background, for channels that stay readable after closing.
+        """
+        task = asyncio.create_task(self.archive_transcript(channel))
+        self.archive_tasks.add(task)
+        task.add_done_callback(self.archive_tasks.discard)
     
     @commands.Cog.listener()
     async def on_ready(self):
         """Called when the bot is ready."""
         print(f"Ticket cog loaded by {self.bot.user}")
         
+        # Catch up on ticket channels deleted while disconnected
+        if not self.is_passive():
+            self.reconcile_deleted_tickets()
+        
         # Add persistent views for buttons to work after restart
         self.bot.add_view(TicketView(self.bot))
         print("Added persistent view for ticket buttons")
@@ -293,6 +413,18 @@ class Ticket(commands.Cog):
                         self.bot.add_view(close_view)
                         print(f"Added persistent view for existing ticket: {channel.name}")
     
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        """
+        Record the first reply from the support team in each open ticket.
+        """
+        if not self.lifecycle.needs_first_response(message.channel.id, message.author.id):
+            return
+        if message.author.bot or not isinstance(message.author, discord.Member):
+            return
+        if message.author.get_role(SUPPORT_ROLE_ID):
+            self.lifecycle.record("first_response", message.channel.id, message.author.id)
+    
     @commands.Cog.listener()
     async def on_guild_channel_delete(self, channel):
         """
@@ -307,8 +439,14 @@ class Ticket(commands.Cog):
         if user_id_to_remove:
             del active_tickets[user_id_to_remove]
             print(f"Cleaned up active ticket for user {user_id_to_remove} due to channel deletion")
+        
+        # Tickets deleted without the close button would otherwise stay open in the stats
+        if channel.id in self.lifecycle.open:
+            self.lifecycle.record("deleted", channel.id)
 
-    @commands.command(name='ticket')
+    @commands.hybrid_command(name='ticket')
+    @app_commands.guild_only()
+    @app_commands.default_permissions(administrator=True)
     @commands.has_role(ADMIN_ROLE_ID)
     async def ticket_command(self, ctx):
         """
@@ -319,11 +457,12 @@ class Ticket(commands.Cog):
             await ctx.send("Ticket system is not configured properly. Please contact an admin.", ephemeral=True)
             return
 
-        # Delete user's command message
-        try:
-            await ctx.message.delete()
-        except:
-            pass
+        # Delete user's command message (slash commands have no message to delete)
+        if ctx.interaction is None:
+            try:
+                await ctx.message.delete()
+            except:
+                pass
 
         view = TicketView(self.bot)
         embed = discord.Embed(
@@ -337,7 +476,9 @@ class Ticket(commands.Cog):
         # Log command usage
         await log_to_channel(self.bot, f"Commande !ticket utilisée par {ctx.author.mention} ({ctx.author.name}) dans {ctx.channel.mention}")
 
-    @commands.command(name='ticketpanel')
+    @commands.hybrid_command(name='ticketpanel')
+    @app_commands.guild_only()
+    @app_commands.default_permissions(administrator=True)
     @commands.has_permissions(administrator=True)
     async def ticket_panel_command(self, ctx):
         """
@@ -360,10 +501,70 @@ class Ticket(commands.Cog):
             delete_after=10
         )
 
+    @commands.hybrid_command(name='ticketstats')
+    @app_commands.guild_only()
+    @app_commands.default_permissions(administrator=True)
+    @commands.has_permissions(administrator=True)
+    async def ticket_stats_command(self, ctx):
+        """
+        Show first response and resolution time percentiles (Admin only).
+        """
+        embed = discord.Embed(
+            title="📊 Ticket Response Times",
+            description=f"{len(self.lifecycle.open)} open tickets, "
+                        f"{len(self.lifecycle.awaiting_response)} waiting for a first reply",
+            color=discord.Color(int("33D26D", 16))
+        )
+        
+        for metric, label in (("first_response", "⏱️ First Response"), ("resolution", "✅ Resolution")):
+            for window, hours in SLA_WINDOWS:
+                count, (p50, p90, p99) = self.lifecycle.percentiles(metric, hours)
+                embed.add_field(
+                    name=f"{label} — {window}",
+                    value=f"p50 {format_duration(p50)} · p90 {format_duration(p90)} · p99 {format_duration(p99)}\n"
+                          f"{count} tickets",
+                    inline=False
+                )
+        
+        await ctx.send(embed=embed, ephemeral=True)
+    
+    @commands.hybrid_command(name='ticketexport')
+    @app_commands.guild_only()
+    @app_commands.default_permissions(administrator=True)
+    @commands.has_permissions(administrator=True)
+    async def ticket_export_command(self, ctx, file_format: Literal["csv", "jsonl"] = "csv", days: int = 30):
+        """
+        Export the ticket event log as CSV or JSONL (Admin only, days=0 for everything).
+        """
+        await ctx.defer(ephemeral=True)
+        
+        # Include events still waiting in the write buffer
+        await self.lifecycle.log.flush()
+        since = time.time() - days * 86400 if days > 0 else 0
+        path = await asyncio.to_thread(self.lifecycle.log.export, file_format, since)
+        
+        try:
+            size_limit = ctx.guild.filesize_limit if ctx.guild else 25 * 1024 * 1024
+            if os.path.getsize(path) > size_limit:
+                await ctx.send("The export is too large to upload. Try fewer days.", ephemeral=True)
+                return
+            await ctx.send(
+                file=discord.File(path, filename=f"ticket_events.{file_format}"),
+                ephemeral=True
+            )
+        finally:
+            os.remove(path)
+        
+        await log_to_channel(self.bot, f"Export des événements tickets ({file_format}, {days} jours) par {ctx.author.mention} ({ctx.author.name})")
+
 async def setup(bot):
     """Setup function to add the cog to the bot."""
     await bot.add_cog(Ticket(bot))
     
+    # Close buttons act on the clicked channel, so one view also covers tickets
+    # created by another instance (e.g. the leader before a standby takeover)
+    bot.add_view(TicketCloseView(bot, None))
+    
     # Wait a bit for the bot to be fully ready
     await asyncio.sleep(2)
     
@@ -4,8 +4,12 @@ import asyncio
 from config import (
     WELCOME_CHANNEL_ID, PUBLIC_WELCOME_MESSAGE, PRIVATE_WELCOME_MESSAGE,
     DELAYED_DM_24H, DELAYED_DM_72H, WELCOME_DELAY_24H, WELCOME_DELAY_72H,
-    LOG_CHANNEL_ID
+    LOG_CHANNEL_ID, WELCOME_DEDUPE_WINDOW, WELCOME_DEDUPE_MAX_ENTRIES,
+    WELCOME_DEDUPE_PATH, WELCOME_DEDUPE_SAVE_DELAY, WELCOME_CARDS_ENABLED
 )
+from utils.clock import loop_clock
+from utils.welcome_filter import RecentlyWelcomed
+from utils.welcome_cards import WelcomeCardRenderer, cards_available
 
 async def log_to_channel(bot, message: str):
     """Send a log message to the configured log channel."""
@@ -17,6 +21,8 @@ async def log_to_channel(bot, message: str):
             except Exception as e:
                 print(f"Failed to send log message: {e}")
 
+DELAYED_DM_TEMPLATES = {"24h": DELAYED_DM_24H, "72h": DELAYED_DM_72H}
+
 class Welcome(commands.Cog):
     """
     Welcome system cog for handling new member greetings and delayed DMs.
@@ -24,7 +30,63 @@ class Welcome(commands.Cog):
     
     def __init__(self, bot):
         self.bot = bot
+        self.clock = loop_clock()  # Follows virtual time under utils.replay
         self.scheduled_dms = {}  # Store scheduled DM tasks
+        self.dm_due = {}  # {(member_id, delay_type): (guild_id, due_timestamp)} for standby handover
+        self.recently_welcomed = RecentlyWelcomed(WELCOME_DEDUPE_WINDOW, WELCOME_DEDUPE_MAX_ENTRIES, self.clock)
+        self.recently_welcomed.load(WELCOME_DEDUPE_PATH)
+        self.save_task = None
+        self.cards = WelcomeCardRenderer(bot) if WELCOME_CARDS_ENABLED and cards_available() else None
+    
+    async def cog_unload(self):
+        """Persist the rejoin filter so it survives restarts and reloads."""
+        if self.cards:
+            await self.cards.close()
+        if self.save_task and not self.save_task.done():
+            self.save_task.cancel()
+        if self.recently_welcomed.dirty:
+            await self.save_recently_welcomed()
+    
+    async def save_recently_welcomed(self):
+        """Write the rejoin filter to disk without blocking the event loop."""
+        rows = self.recently_welcomed.snapshot()
+        try:
+            await asyncio.to_thread(RecentlyWelcomed.save, WELCOME_DEDUPE_PATH, rows)
+        except OSError as e:
+            print(f"Failed to save welcome history to {WELCOME_DEDUPE_PATH}: {e}")
+    
+    async def save_recently_welcomed_later(self):
+        """Batch saves so a join wave writes the file once."""
+        await asyncio.sleep(WELCOME_DEDUPE_SAVE_DELAY)
+        await self.save_recently_welcomed()
+    
+    def export_handover(self):
+        """Pending delayed DMs, for a standby instance taking over."""
+        return {
+            "dms": [
+                [guild_id, member_id, delay_type, due]
+                for (member_id, delay_type), (guild_id, due) in self.dm_due.items()
+            ]
+        }
+    
+    async def import_handover(self, state):
+        """
+        Resume the previous active instance's delayed DMs and rejoin filter.
+        """
+        self.recently_welcomed = RecentlyWelcomed(WELCOME_DEDUPE_WINDOW, WELCOME_DEDUPE_MAX_ENTRIES, self.clock)
+        self.recently_welcomed.load(WELCOME_DEDUPE_PATH)
+        
+        restored = 0
+        now = self.clock()
+        for guild_id, member_id, delay_type, due in state.get("dms", []):
+            guild = self.bot.get_guild(guild_id)
+            member = guild.get_member(member_id) if guild else None
+            if member is None or delay_type not in DELAYED_DM_TEMPLATES:
+                continue
+            self.schedule_delayed_dm(member, delay_type, max(0, due - now))
+            restored += 1
+        if restored:
+            print(f"Restored {restored} delayed DMs from the previous instance")
     
     @commands.Cog.listener()
     async def on_ready(self):
@@ -41,13 +103,24 @@ class Welcome(commands.Cog):
         if member.bot:
             return
         
+        # Skip greetings for members who rejoin within the dedupe window
+        if self.recently_welcomed.seen(member.guild.id, member.id):
+            print(f"Suppressed welcome for {member.name} (rejoined, {self.recently_welcomed.suppressed} suppressed so far)")
+            return
+        
+        if self.save_task is None or self.save_task.done():
+            self.save_task = asyncio.create_task(self.save_recently_welcomed_later())
+        
         # Log member join
         await log_to_channel(self.bot, f"@{member.name} ({member.display_name}) a rejoint le serveur")
         
         # Send public welcome message
         if WELCOME_CHANNEL_ID != 0:
             welcome_channel = self.bot.get_channel(WELCOME_CHANNEL_ID)
-            if welcome_channel:
+            if welcome_channel and self.cards:
+                # Rendered off the event loop; join waves are coalesced into one collage
+                self.cards.submit(member, welcome_channel)
+            elif welcome_channel:
                 try:
                     public_message = PUBLIC_WELCOME_MESSAGE.format(
                         user_mention=member.mention,
@@ -77,21 +150,20 @@ class Welcome(commands.Cog):
         """
         Schedule delayed DMs for 24h and 72h after member joins.
         """
-        # Schedule 24-hour DM
-        task_24h = asyncio.create_task(self.send_delayed_dm(
-            member, DELAYED_DM_24H, WELCOME_DELAY_24H, "24h"
-        ))
-        
-        # Schedule 72-hour DM
-        task_72h = asyncio.create_task(self.send_delayed_dm(
-            member, DELAYED_DM_72H, WELCOME_DELAY_72H, "72h"
+        self.schedule_delayed_dm(member, "24h", WELCOME_DELAY_24H)
+        self.schedule_delayed_dm(member, "72h", WELCOME_DELAY_72H)
+    
+    def schedule_delayed_dm(self, member, delay_type, delay):
+        """
+        Schedule one delayed DM and remember when it's due.
+        """
+        task = asyncio.create_task(self.send_delayed_dm(
+            member, DELAYED_DM_TEMPLATES[delay_type], delay, delay_type
         ))
         
         # Store tasks so they don't get garbage collected
-        self.scheduled_dms[member.id] = {
-            "24h": task_24h,
-            "72h": task_72h
-        }
+        self.scheduled_dms.setdefault(member.id, {})[delay_type] = task
+        self.dm_due[(member.id, delay_type)] = (member.guild.id, self.clock() + delay)
     
     async def send_delayed_dm(self, member, message_template, delay, delay_type):
         """
@@ -118,6 +190,7 @@ class Welcome(commands.Cog):
             # Clean up the task from scheduled_dms
             if member.id in self.scheduled_dms and delay_type in self.scheduled_dms[member.id]:
                 del self.scheduled_dms[member.id][delay_type]
+            self.dm_due.pop((member.id, delay_type), None)
     
     @commands.Cog.listener()
     async def on_member_remove(self, member):
@@ -130,6 +203,8 @@ class Welcome(commands.Cog):
                 if not task.done():
                     task.cancel()
             del self.scheduled_dms[member.id]
+            for delay_type in DELAYED_DM_TEMPLATES:
+                self.dm_due.pop((member.id, delay_type), None)
             print(f"Cleaned up scheduled DMs for {member.name}")
 
 async def setup(bot):
@@ -6,6 +6,10 @@ load_dotenv()
 # Bot Configuration
 DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
 BOT_PREFIX = "!"
+# Message content is only needed for legacy ! prefix commands; slash commands work without it
+MESSAGE_CONTENT_INTENT = os.getenv('MESSAGE_CONTENT_INTENT', 'false').lower() == 'true'
+# Hash of the last synced slash command tree, so restarts skip the rate-limited sync
+COMMAND_HASH_PATH = os.getenv('COMMAND_HASH_PATH', 'command_tree.hash')
 
 # Server Configuration
 WELCOME_CHANNEL_ID = int(os.getenv('WELCOME_CHANNEL_ID', 0))
@@ -88,4 +92,36 @@ BOT_ACTIVITY = os.getenv('BOT_ACTIVITY', "https://thumblab.app")
 # Time delays (in seconds)
 WELCOME_DELAY_24H = 24 * 60 * 60
 WELCOME_DELAY_72H = 72 * 60 * 60
-TICKET_CLOSE_DELAY = 5
\ No newline at end of file
+TICKET_CLOSE_DELAY = 5
+
+# Ticket lifecycle event log (append-only JSONL)
+TICKET_EVENTS_PATH = os.getenv('TICKET_EVENTS_PATH', 'ticket_events.jsonl')
+TICKET_EVENTS_FLUSH_DELAY = 10
+
+# Hot standby: instances share a lease file and only the holder is active
+STANDBY_ENABLED = os.getenv('STANDBY_ENABLED', 'false').lower() == 'true'
+INSTANCE_ID = os.getenv('INSTANCE_ID', f"{os.uname().nodename}-{os.getpid()}" if hasattr(os, 'uname') else str(os.getpid()))
+LEASE_PATH = os.getenv('LEASE_PATH', 'lease.sqlite3')
+LEASE_TTL = 10  # Seconds a crashed leader keeps the lease
+LEASE_HEARTBEAT = 1  # Seconds between lease renewals / acquisition attempts
+HANDOVER_SNAPSHOT_INTERVAL = 30  # Seconds between state snapshots, for crash failover
+
+# Rejoin dedupe: members welcomed within this window aren't greeted or DMed again
+WELCOME_DEDUPE_WINDOW = int(os.getenv('WELCOME_DEDUPE_WINDOW', 7 * 24 * 60 * 60))
+WELCOME_DEDUPE_MAX_ENTRIES = int(os.getenv('WELCOME_DEDUPE_MAX_ENTRIES', 20000))
+WELCOME_DEDUPE_PATH = os.getenv('WELCOME_DEDUPE_PATH', 'welcome_dedupe.json')
+WELCOME_DEDUPE_SAVE_DELAY = 30
+
+# Event recording (gzip JSONL path, empty to disable)
+RECORD_EVENTS_PATH = os.getenv('RECORD_EVENTS_PATH', '')
+
+# Ticket transcripts (worker processes rendering HTML transcripts)
+TRANSCRIPT_WORKERS = int(os.getenv('TRANSCRIPT_WORKERS', 2))
+
+# Welcome cards (image cards rendered with Pillow; falls back to text if it isn't installed)
+WELCOME_CARDS_ENABLED = os.getenv('WELCOME_CARDS_ENABLED', 'true').lower() == 'true'
+WELCOME_CARD_BACKGROUND = os.getenv('WELCOME_CARD_BACKGROUND', '')  # Template image path, empty for a gradient
+WELCOME_CARD_FONT = os.getenv('WELCOME_CARD_FONT', '')  # TrueType font path, empty for Pillow's default
+WELCOME_CARD_WORKERS = int(os.getenv('WELCOME_CARD_WORKERS', 2))
+WELCOME_CARD_COALESCE_WINDOW = 5  # Seconds; joins inside the window share one collage card
+WELCOME_CARD_CACHE_SIZE = 256  # Prepared avatars kept in memory
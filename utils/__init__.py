@@ -0,0 +1,4 @@
+"""
+Utilities package for Discord Support Bot
+This package contains helpers shared by the bot and its cogs.
+"""
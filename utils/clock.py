@@ -0,0 +1,12 @@
+import asyncio
+import time
+
+def loop_clock():
+    """
+    Return a wall-clock function that advances with the running event loop.
+    Timestamps stay comparable with time.time() across restarts, but follow the
+    virtual clock when the cogs run under utils.replay.
+    """
+    loop = asyncio.get_running_loop()
+    offset = time.time() - loop.time()
+    return lambda: loop.time() + offset
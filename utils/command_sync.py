@@ -0,0 +1,41 @@
+import hashlib
+import json
+import os
+from config import COMMAND_HASH_PATH
+
+def command_tree_hash(bot):
+    """
+    Hash the global application command definitions as they would be sent to Discord.
+    """
+    payload = [command.to_dict() for command in bot.tree.get_commands()]
+    payload.sort(key=lambda command: command["name"])
+    definition = json.dumps([bot.application_id, payload], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(definition.encode("utf-8")).hexdigest()
+
+async def sync_command_tree(bot, path=COMMAND_HASH_PATH):
+    """
+    Sync slash commands only when their definitions changed since the last sync.
+    The sync endpoint is heavily rate limited, so restarts shouldn't hit it.
+    Returns True if a sync was performed.
+    """
+    current_hash = command_tree_hash(bot)
+    try:
+        with open(path, "r", encoding="utf-8") as hash_file:
+            if hash_file.read().strip() == current_hash:
+                print("🌳 Slash commands unchanged, skipping sync")
+                return False
+    except FileNotFoundError:
+        pass
+
+    synced = await bot.tree.sync()
+    print(f"🌳 Synced {len(synced)} slash commands")
+
+    try:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as hash_file:
+            hash_file.write(current_hash)
+    except OSError as e:
+        print(f"Failed to store command tree hash in {path}: {e}")
+    return True
@@ -0,0 +1,389 @@
+"""
+Hot-standby support: lease-based leader election in a shared SQLite file.
+
+Failover benchmark: python -m utils.leader_lease --benchmark
+"""
+import asyncio
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import random
+import signal
+import sqlite3
+import tempfile
+import time
+import types
+from config import LEASE_TTL, LEASE_HEARTBEAT, HANDOVER_SNAPSHOT_INTERVAL
+
+# Events still dispatched while passive, so the standby stays connected and loads its cogs
+PASSIVE_EVENTS = {"connect", "disconnect", "ready", "resumed", "cogs_loaded", "socket_raw_receive"}
+
+class LeaderLease:
+    """
+    A named lease row in SQLite. BEGIN IMMEDIATE takes the file's write lock,
+    so acquire/renew are atomic across processes sharing the file.
+    """
+
+    def __init__(self, path, holder, ttl, name="support-bot"):
+        self.path = path
+        self.holder = holder
+        self.ttl = ttl
+        self.name = name
+        self.expires = 0.0  # When our lease lapses if we can't renew it
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS lease (name TEXT PRIMARY KEY, holder TEXT, expires REAL)")
+            db.execute("CREATE TABLE IF NOT EXISTS handover (name TEXT PRIMARY KEY, holder TEXT, written REAL, state TEXT)")
+
+    def connect(self):
+        # Autocommit mode so BEGIN IMMEDIATE controls the transaction
+        return sqlite3.connect(self.path, timeout=self.ttl / 2, isolation_level=None)
+
+    def acquire(self):
+        """
+        Take the lease if it's free, expired or already ours. Returns True if we hold it.
+        """
+        now = time.time()
+        db = self.connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute("SELECT holder, expires FROM lease WHERE name = ?", (self.name,)).fetchone()
+            if row and row[0] != self.holder and row[1] > now:
+                db.execute("ROLLBACK")
+                return False
+            db.execute(
+                "INSERT OR REPLACE INTO lease (name, holder, expires) VALUES (?, ?, ?)",
+                (self.name, self.holder, now + self.ttl)
+            )
+            db.execute("COMMIT")
+            self.expires = now + self.ttl
+            return True
+        finally:
+            db.close()
+
+    def renew(self):
+        """
+        Extend the lease only if we still hold it. Returns False if another instance took it.
+        """
+        now = time.time()
+        db = self.connect()
+        try:
+            cursor = db.execute(
+                "UPDATE lease SET expires = ? WHERE name = ? AND holder = ?",
+                (now + self.ttl, self.name, self.holder)
+            )
+            if cursor.rowcount:
+                self.expires = now + self.ttl
+            return cursor.rowcount == 1
+        finally:
+            db.close()
+
+    def release(self, state=None):
+        """
+        Write the handover state (if any) and expire our lease so a standby can take over at once.
+        """
+        db = self.connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            if state is not None:
+                self._write_handover(db, state)
+            db.execute("UPDATE lease SET expires = 0 WHERE name = ? AND holder = ?", (self.name, self.holder))
+            db.execute("COMMIT")
+            self.expires = 0.0
+        finally:
+            db.close()
+
+    def write_handover(self, state):
+        db = self.connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            self._write_handover(db, state)
+            db.execute("COMMIT")
+        finally:
+            db.close()
+
+    def _write_handover(self, db, state):
+        # Only the lease holder may overwrite the snapshot
+        row = db.execute("SELECT holder FROM lease WHERE name = ?", (self.name,)).fetchone()
+        if row and row[0] == self.holder:
+            db.execute(
+                "INSERT OR REPLACE INTO handover (name, holder, written, state) VALUES (?, ?, ?, ?)",
+                (self.name, self.holder, time.time(), json.dumps(state, separators=(",", ":")))
+            )
+
+    def read_handover(self):
+        db = self.connect()
+        try:
+            row = db.execute("SELECT state FROM handover WHERE name = ?", (self.name,)).fetchone()
+            return json.loads(row[0]) if row else {}
+        finally:
+            db.close()
+
+class StandbyController:
+    """
+    Keep a fully connected client passive until it holds the lease.
+    While passive, gateway events still update the cache but aren't dispatched to cogs,
+    and interactions are left for the active instance to answer.
+    """
+
+    def __init__(self, bot, lease):
+        self.bot = bot
+        self.lease = lease
+        self.active = False
+        self.stepped_down = False
+        self.task = None
+        self.heartbeat = LEASE_HEARTBEAT
+
+    def install(self):
+        """
+        Gate event dispatch and interactions, and hook startup and shutdown.
+        Must be called before the bot connects.
+        """
+        dispatch = self.bot.dispatch
+
+        def gated_dispatch(event_name, *args, **kwargs):
+            if self.active or event_name in PASSIVE_EVENTS:
+                dispatch(event_name, *args, **kwargs)
+
+        # The connection state keeps its own reference to the dispatcher
+        self.bot.dispatch = gated_dispatch
+        self.bot._connection.dispatch = gated_dispatch
+
+        # Component and slash command interactions bypass dispatch
+        parsers = self.bot._connection.parsers
+        parse_interaction = parsers["INTERACTION_CREATE"]
+        parsers["INTERACTION_CREATE"] = lambda data: parse_interaction(data) if self.active else None
+
+        setup_hook = self.bot.setup_hook
+        close = self.bot.close
+
+        async def standby_setup_hook():
+            await setup_hook()
+            try:
+                # Docker stops containers with SIGTERM; treat it as a graceful shutdown
+                asyncio.get_running_loop().add_signal_handler(
+                    signal.SIGTERM, lambda: asyncio.create_task(self.bot.close())
+                )
+            except NotImplementedError:
+                pass  # Signal handlers aren't available on Windows
+            self.task = asyncio.create_task(self.run())
+
+        async def standby_close():
+            state = self.export_state() if self.active else None
+            # Cogs flush their files while unloading, before the standby is let in
+            await close()
+            if self.active and not self.stepped_down:
+                self.stepped_down = True
+                await asyncio.to_thread(self.lease.release, state)
+                print("👋 Released leadership lease")
+
+        self.bot.setup_hook = standby_setup_hook
+        self.bot.close = standby_close
+        # Lets cogs skip writing shared files while passive
+        self.bot.standby = self
+        print(f"⏸️ Starting as standby instance {self.lease.holder}")
+
+    async def run(self):
+        """
+        Heartbeat loop: renew the lease while active, try to acquire it while passive.
+        """
+        await self.bot.wait_for("cogs_loaded")
+        last_snapshot = time.time()
+
+        while not self.bot.is_closed():
+            try:
+                if self.active:
+                    if not await asyncio.to_thread(self.lease.renew):
+                        await self.lose_lease()
+                        return
+                    if time.time() - last_snapshot >= HANDOVER_SNAPSHOT_INTERVAL:
+                        await asyncio.to_thread(self.lease.write_handover, self.export_state())
+                        last_snapshot = time.time()
+                elif await asyncio.to_thread(self.lease.acquire):
+                    await self.promote()
+                    last_snapshot = time.time()
+            except sqlite3.Error as e:
+                print(f"⚠️ Lease store error: {e}")
+                if self.active and time.time() >= self.lease.expires:
+                    await self.lose_lease()
+                    return
+            await asyncio.sleep(self.heartbeat)
+
+    async def promote(self):
+        """
+        Become the active instance and restore the previous leader's state.
+        """
+        started = time.perf_counter()
+        state = await asyncio.to_thread(self.lease.read_handover)
+        for name, cog in self.bot.cogs.items():
+            if hasattr(cog, "import_handover"):
+                try:
+                    await cog.import_handover(state.get(name, {}))
+                except Exception as e:
+                    print(f"⚠️ Failed to restore {name} state: {e}")
+        self.active = True
+        print(f"👑 {self.lease.holder} is now the active instance (restored state in {(time.perf_counter() - started) * 1000:.0f}ms)")
+
+    async def lose_lease(self):
+        """
+        Another instance took over (e.g. after we stalled). Exit rather than act twice;
+        the restart policy brings this process back as a standby.
+        """
+        print(f"⚠️ {self.lease.holder} lost the leadership lease, shutting down")
+        self.active = False
+        self.stepped_down = True
+        await self.bot.close()
+
+    def export_state(self):
+        return {
+            name: cog.export_handover()
+            for name, cog in self.bot.cogs.items()
+            if hasattr(cog, "export_handover")
+        }
+
+class _StubBot:
+    """
+    Just enough of commands.Bot for StandbyController and the real cogs, without a gateway.
+    """
+
+    def __init__(self):
+        self.cogs = {}
+        self.closed = False
+        self.waiters = collections.defaultdict(list)
+        self._connection = types.SimpleNamespace(dispatch=self.dispatch, parsers={"INTERACTION_CREATE": lambda data: None})
+
+    def dispatch(self, event_name, *args, **kwargs):
+        for future in self.waiters.pop(event_name, []):
+            future.set_result(args)
+
+    async def wait_for(self, event_name):
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[event_name].append(future)
+        return await future
+
+    async def setup_hook(self):
+        pass
+
+    async def close(self):
+        self.closed = True
+        for cog in self.cogs.values():
+            await cog.cog_unload()
+
+    def is_closed(self):
+        return self.closed
+
+    def is_ready(self):
+        return True
+
+    @property
+    def guilds(self):
+        return []
+
+    def get_channel(self, channel_id):
+        # Every ticket channel in the synthetic log still exists
+        return types.SimpleNamespace(id=channel_id)
+
+async def _run_contender(path, holder, ttl, heartbeat, events):
+    # Import after pointing the cog at the benchmark's ticket log
+    import config
+    config.TICKET_EVENTS_PATH = os.path.join(os.path.dirname(path), "ticket_events.jsonl")
+    from cogs.ticket import Ticket
+
+    bot = _StubBot()
+    controller = StandbyController(bot, LeaderLease(path, holder, ttl))
+    controller.heartbeat = heartbeat
+    controller.install()
+
+    promote = controller.promote
+
+    async def timed_promote():
+        await promote()
+        events.put((holder, time.time(), len(bot.cogs["Ticket"].lifecycle.open)))
+
+    controller.promote = timed_promote
+    await bot.setup_hook()
+
+    # Load the cog as bot.py does on ready: cog_load reads the whole log
+    cog = Ticket(bot)
+    await cog.cog_load()
+    bot.cogs["Ticket"] = cog
+    bot.dispatch("cogs_loaded")
+    while not bot.is_closed():
+        await asyncio.sleep(heartbeat)
+
+def _contender(path, holder, ttl, heartbeat, events):
+    """
+    Benchmark process: the real StandbyController and Ticket cog on a stub bot.
+    """
+    asyncio.run(_run_contender(path, holder, ttl, heartbeat, events))
+
+def _write_ticket_events(path, first_channel, count):
+    """
+    Append `count` synthetic tickets (opened, first response, closed), leaving every tenth open.
+    """
+    now = time.time()
+    with open(path, "a", encoding="utf-8") as log_file:
+        for channel in range(first_channel, first_channel + count):
+            t = now - 86400 + channel % 86400
+            log_file.write(json.dumps({"t": t, "event": "opened", "channel": channel, "user": 1}) + "\n")
+            if channel % 10:
+                log_file.write(json.dumps({"t": t + 60, "event": "first_response", "channel": channel, "user": 2, "after": 60}) + "\n")
+                log_file.write(json.dumps({"t": t + 600, "event": "closed", "channel": channel, "user": 2, "after": 600}) + "\n")
+
+def _benchmark(ttl, heartbeat, tickets):
+    """
+    Measure takeover time, up to the standby being active with its state restored,
+    after the leader is killed and after it shuts down gracefully.
+    """
+    from utils.ticket_events import TicketEventLog, TicketLifecycle
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "lease.sqlite3")
+    log_path = os.path.join(directory, "ticket_events.jsonl")
+    _write_ticket_events(log_path, 0, tickets)
+    started = time.perf_counter()
+    TicketLifecycle(TicketEventLog(log_path, 0)).load()
+    print(f"ticket log: {tickets} tickets, {os.path.getsize(log_path) // 1024} KiB, full rebuild {time.perf_counter() - started:.2f}s")
+
+    events = multiprocessing.Queue()
+
+    def start(holder):
+        process = multiprocessing.Process(target=_contender, args=(path, holder, ttl, heartbeat, events), daemon=True)
+        process.start()
+        return process
+
+    leader = start("a")
+    events.get(timeout=60)
+    standby = start("b")
+    time.sleep(heartbeat * (2 + random.random()) + 2)  # Let it load; don't align with its polling
+    # Tickets handled by the leader after the standby loaded the log
+    _write_ticket_events(log_path, tickets, 1000)
+
+    killed_at = time.time()
+    os.kill(leader.pid, signal.SIGKILL)
+    holder, acquired_at, open_tickets = events.get(timeout=ttl * 3)
+    print(f"leader killed (SIGKILL): {holder} active after {acquired_at - killed_at:.2f}s with {open_tickets} open tickets (ttl {ttl}s, heartbeat {heartbeat}s)")
+
+    second_standby = start("c")
+    time.sleep(heartbeat * (2 + random.random()) + 2)  # Let it load; don't align with its polling
+    stopped_at = time.time()
+    standby.terminate()
+    holder, acquired_at, open_tickets = events.get(timeout=ttl * 3)
+    print(f"leader stopped (SIGTERM): {holder} active after {acquired_at - stopped_at:.2f}s with {open_tickets} open tickets")
+    second_standby.kill()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark lease failover.")
+    parser.add_argument("--benchmark", action="store_true")
+    parser.add_argument("--ttl", type=float, default=LEASE_TTL)
+    parser.add_argument("--heartbeat", type=float, default=LEASE_HEARTBEAT)
+    parser.add_argument("--tickets", type=int, default=100000, help="tickets in the shared event log")
+    args = parser.parse_args()
+    if args.benchmark:
+        _benchmark(args.ttl, args.heartbeat, args.tickets)
+    else:
+        parser.print_help()
@@ -0,0 +1,232 @@
+import discord
+from discord.webhook.async_ import async_context
+import asyncio
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import re
+import threading
+import time
+from config import BOT_PREFIX
+
+# Log format version written in every session header
+LOG_VERSION = 1
+
+# Keys whose values are secrets or PII and never written to disk
+SECRET_KEYS = {"token", "access_token", "session_id", "resume_gateway_url", "email", "phone", "ip"}
+# Keys holding user-chosen names, replaced with a stable pseudonym
+NAME_KEYS = {"username", "global_name", "nick", "display_name"}
+# Keys holding CDN hashes or URLs that identify a user
+ASSET_KEYS = {"avatar", "banner", "avatar_decoration", "url", "proxy_url"}
+# Keys holding a user snowflake, replaced with a stable pseudonymous snowflake
+USER_ID_KEYS = {"user_id", "recipient_id", "owner_id", "users"}
+# Keys holding a user object or a list of them, whose "id" is a user snowflake
+USER_OBJECT_KEYS = {"user", "author", "recipients", "mentions", "users"}
+# Keys holding a mapping keyed by user snowflake, like resolved interaction options
+USER_MAP_KEYS = {"users", "members"}
+
+# Interaction and webhook tokens appear as path segments in REST routes
+TOKEN_PATH = re.compile(r"^(/(?:interactions|webhooks)/\d+/)[^/?]+")
+# User snowflakes appear as path segments after these collections
+USER_PATH = re.compile(r"(/(?:users|members|bans|recipients)/)(\d+)")
+# Permission overwrites target a member or a role; the request body says which
+OVERWRITE_PATH = re.compile(r"(/permissions/)(\d+)")
+
+def route_path(route):
+    """
+    Return the path of a REST route relative to the API base, with tokens removed.
+    """
+    path = route.url.split("/api/v10", 1)[-1]
+    return TOKEN_PATH.sub(r"\1redacted", path)
+
+def read_log(path):
+    """
+    Yield records from a recorded log, converting offsets to absolute timestamps.
+    """
+    started = 0.0
+    with gzip.open(path, "rt", encoding="utf-8") as log_file:
+        for line in log_file:
+            record = json.loads(line)
+            if record[0] == "H":
+                started = record[2]
+                continue
+            record[1] += started
+            yield record
+
+class Redactor:
+    """
+    Strip tokens and PII from gateway payloads and REST bodies.
+    Names and user ids are replaced with keyed hashes so they stay consistent within one log.
+    """
+
+    def __init__(self, command_names=lambda: ()):
+        # A per-recording key, never written, so pseudonyms can't be reversed by guessing names
+        self.key = os.urandom(16)
+        # Prefix commands are kept in message content so replays still run them
+        self.command_names = command_names
+
+    def digest(self, value):
+        return hmac.new(self.key, value.encode("utf-8"), hashlib.sha256).hexdigest()
+
+    def pseudonym(self, value):
+        return f"user-{self.digest(value)[:8]}"
+
+    def user_id(self, value):
+        """
+        Map a user snowflake to a pseudonymous one, so replays can still parse it.
+        """
+        if not value.isdigit():
+            return value
+        # 18 digits, like snowflakes of accounts created since 2016
+        return str(10**17 + int(self.digest(value)[:15], 16) % (9 * 10**17))
+
+    def content(self, value):
+        """
+        Keep the name of a known prefix command and redact everything else, keeping the length.
+        """
+        if value.startswith(BOT_PREFIX):
+            name, _, args = value[len(BOT_PREFIX):].partition(" ")
+            if name in self.command_names():
+                kept = BOT_PREFIX + name + (" " if args or value.endswith(" ") else "")
+                return kept + "x" * len(args)
+        return "x" * len(value)
+
+    def route(self, route, body=None):
+        """
+        Return route_path(route) with user snowflakes pseudonymized like in payloads.
+        """
+        path = USER_PATH.sub(lambda m: m.group(1) + self.user_id(m.group(2)), route_path(route))
+        if isinstance(body, dict) and body.get("type") == 1:
+            path = OVERWRITE_PATH.sub(lambda m: m.group(1) + self.user_id(m.group(2)), path)
+        return path
+
+    def redact(self, value, key=None, user=False):
+        """
+        Return a redacted copy of a JSON value. user is set for values inside a user object.
+        """
+        if isinstance(value, dict):
+            if key in USER_MAP_KEYS and all(k.isdigit() for k in value):
+                return {self.user_id(k): self.redact(v, key) for k, v in value.items()}
+            # Member permission overwrites (type 1) target a user id
+            user = key in USER_OBJECT_KEYS or "username" in value or ("allow" in value and value.get("type") == 1)
+            return {k: self.redact(v, k, user) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.redact(v, key) for v in value]
+        if value is None or not isinstance(value, str):
+            return value
+        if key in SECRET_KEYS:
+            return "redacted"
+        if key in USER_ID_KEYS or (user and key == "id"):
+            return self.user_id(value)
+        if key in NAME_KEYS:
+            return self.pseudonym(value)
+        if key in ASSET_KEYS:
+            return None
+        if key == "name" and value.startswith("ticket-"):
+            # Ticket channels are named after their creator
+            return f"ticket-{self.pseudonym(value[7:])[5:]}"
+        if key == "content":
+            return self.content(value)
+        if key in ("topic", "filename", "description"):
+            # Keep the length so replays send payloads of realistic size
+            return "x" * len(value)
+        return value
+
+class EventRecorder:
+    """
+    Capture incoming gateway dispatches and outgoing REST calls to a compact gzip log.
+    Each line is a JSON list: ["D", t, event, data] or ["R", t, method, path, body, status, response].
+    """
+
+    def __init__(self, bot, path, flush_every=200):
+        self.bot = bot
+        self.path = path
+        self.flush_every = flush_every
+        self.redactor = Redactor(lambda: bot.all_commands)
+        self.started = time.time()
+        self.buffer = []
+        self.records = 0
+        self.flush_task = None
+        self.write_lock = threading.Lock()  # One gzip member appended at a time, in order
+
+    def install(self):
+        """
+        Hook the bot's gateway and REST clients. The bot must be created with enable_debug_events=True.
+        """
+        self.buffer.append(json.dumps(["H", LOG_VERSION, self.started]))
+        self.bot.add_listener(self.on_socket_raw_receive)
+        self.bot.http.request = self.wrap_request(self.bot.http.request)
+        # Interaction responses bypass HTTPClient and go through the webhook adapter
+        adapter = async_context.get()
+        adapter.request = self.wrap_request(adapter.request)
+        print(f"🎥 Recording gateway and REST traffic to {self.path}")
+
+    def offset(self):
+        return round(time.time() - self.started, 3)
+
+    def write(self, record):
+        self.buffer.append(json.dumps(record, separators=(",", ":"), ensure_ascii=False))
+        self.records += 1
+        # Records arriving during a write stay buffered for the next flush
+        if len(self.buffer) >= self.flush_every and (self.flush_task is None or self.flush_task.done()):
+            self.flush_task = asyncio.create_task(self.flush())
+
+    async def flush(self):
+        """
+        Append buffered records to the log without blocking the event loop.
+        """
+        if not self.buffer:
+            return
+        lines, self.buffer = self.buffer, []
+        await asyncio.to_thread(self._write, lines)
+
+    def _write(self, lines):
+        """
+        Append lines to the log as a new gzip member.
+        """
+        with self.write_lock:
+            try:
+                with gzip.open(self.path, "at", encoding="utf-8") as log_file:
+                    log_file.write("\n".join(lines) + "\n")
+            except OSError as e:
+                print(f"Failed to write event log {self.path}: {e}")
+
+    def close(self):
+        """
+        Write the remaining records synchronously; called after the event loop has stopped.
+        """
+        if self.buffer:
+            lines, self.buffer = self.buffer, []
+            self._write(lines)
+        print(f"🎥 Recorded {self.records} events to {self.path}")
+
+    async def on_socket_raw_receive(self, msg):
+        """
+        Record gateway dispatches (op 0); heartbeats and hellos are not needed for replay.
+        """
+        payload = json.loads(msg)
+        if payload.get("op") != 0:
+            return
+        self.write(["D", self.offset(), payload["t"], self.redactor.redact(payload["d"])])
+
+    def wrap_request(self, request):
+        """
+        Wrap a REST request coroutine so each call and its response are recorded.
+        """
+        async def recorded_request(route, *args, **kwargs):
+            started = self.offset()
+            raw_body = kwargs.get("json", kwargs.get("payload"))
+            path = self.redactor.route(route, raw_body)
+            body = self.redactor.redact(raw_body)
+            try:
+                response = await request(route, *args, **kwargs)
+            except discord.HTTPException as e:
+                error = {"code": e.code, "message": e.text}
+                self.write(["R", started, route.method, path, body, e.status, error])
+                raise
+            self.write(["R", started, route.method, path, body, 200, self.redactor.redact(response)])
+            return response
+
+        return recorded_request
@@ -0,0 +1,323 @@
+"""
+Replay a recorded gateway/REST log against the real cogs.
+
+Usage: python -m utils.replay events.jsonl.gz [--speed 3600 | --fast] [--tail SECONDS]
+"""
+import discord
+from discord.ext import commands
+from discord.webhook.async_ import async_context
+import argparse
+import asyncio
+import collections
+import itertools
+import math
+import os
+import selectors
+import tempfile
+import time
+import config
+from config import BOT_PREFIX, MESSAGE_CONTENT_INTENT
+from utils.recorder import read_log, route_path
+
+class VirtualClock:
+    """
+    Event loop clock running `speed` times faster than real time.
+    With an infinite speed, idle waits are skipped entirely.
+    """
+
+    def __init__(self, speed=1.0):
+        self.speed = speed
+        self.started = time.monotonic()
+        self.skipped = 0.0
+
+    def now(self):
+        elapsed = time.monotonic() - self.started
+        if math.isinf(self.speed):
+            return elapsed + self.skipped
+        return elapsed * self.speed + self.skipped
+
+class VirtualSelector(selectors.DefaultSelector):
+    """
+    Selector that converts the loop's virtual timeouts into real ones.
+    """
+
+    def __init__(self, clock):
+        super().__init__()
+        self.clock = clock
+        self.executor_futures = set()  # Thread/process pool work in flight
+
+    def select(self, timeout=None):
+        if timeout is None or timeout <= 0:
+            return super().select(timeout)
+        if math.isinf(self.clock.speed):
+            if self.executor_futures:
+                # Pool work runs in real time and wakes the loop when it's done; don't skip past it
+                return super().select(timeout)
+            # Nothing is ready: jump straight to the next scheduled timer
+            events = super().select(0)
+            if not events:
+                self.clock.skipped += timeout
+            return events
+        return super().select(timeout / self.clock.speed)
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """
+    Event loop whose time() and sleeps follow a VirtualClock, so the 24h/72h
+    welcome timers fire in seconds during a replay.
+    """
+
+    def __init__(self, clock):
+        selector = VirtualSelector(clock)
+        super().__init__(selector)
+        self.clock = clock
+        self.executor_futures = selector.executor_futures
+
+    def time(self):
+        return self.clock.now()
+
+    def run_in_executor(self, executor, func, *args):
+        # Also covers asyncio.to_thread; tracked so idle time isn't skipped while work runs
+        future = super().run_in_executor(executor, func, *args)
+        self.executor_futures.add(future)
+        future.add_done_callback(self.executor_futures.discard)
+        return future
+
+    async def drain(self):
+        """
+        Wait for pool work in flight and the callbacks it hands back to the loop,
+        e.g. a rendered welcome card being sent.
+        """
+        while True:
+            if self.executor_futures:
+                await asyncio.wait(set(self.executor_futures))
+            elif self._ready:
+                await asyncio.sleep(0)
+            else:
+                return
+
+class StandInResponse:
+    """
+    Minimal response object for raising discord.HTTPException from recorded errors.
+    """
+
+    def __init__(self, status):
+        self.status = status
+        self.reason = "Replayed"
+
+class RestStandIn:
+    """
+    Local stand-in for the Discord REST API.
+    Serves recorded responses in order per route and synthesizes plausible ones for calls the log doesn't have.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.responses = collections.defaultdict(collections.deque)
+        self.ids = itertools.count()
+        self.served = 0
+        self.synthesized = collections.Counter()
+
+    def install(self):
+        """
+        Route the bot's REST and interaction webhook calls to this stand-in.
+        """
+        self.bot.http.request = self.request
+        async_context.get().request = self.request
+
+    def add(self, method, path, status, response):
+        self.responses[(method, path)].append((status, response))
+
+    def snowflake(self):
+        return discord.utils.time_snowflake(discord.utils.utcnow()) + next(self.ids)
+
+    async def request(self, route, *args, **kwargs):
+        method, path = route.method, route_path(route)
+        body = kwargs.get("json", kwargs.get("payload")) or {}
+        queue = self.responses.get((method, path))
+        if not queue:
+            self.synthesized[f"{method} {route.path}"] += 1
+            return self.synthesize(method, path, body)
+
+        self.served += 1
+        status, response = queue.popleft()
+        if status == 403:
+            raise discord.Forbidden(StandInResponse(status), response)
+        if status == 404:
+            raise discord.NotFound(StandInResponse(status), response)
+        if status >= 400:
+            raise discord.HTTPException(StandInResponse(status), response)
+        return response
+
+    def synthesize(self, method, path, body):
+        """
+        Build a response for a call missing from the log, e.g. after a cog change.
+        """
+        parts = path.strip("/").split("/")
+        if method == "GET" and parts[-1] == "messages":
+            return []
+        if method == "POST" and path == "/users/@me/channels":
+            recipient = {"id": str(body.get("recipient_id")), "username": "user", "discriminator": "0", "avatar": None}
+            return {"id": str(self.snowflake()), "type": 1, "recipients": [recipient]}
+        if method == "POST" and parts[0] == "channels" and parts[-1] == "messages":
+            return {
+                "id": str(self.snowflake()),
+                "channel_id": parts[1],
+                "author": self.bot.user._to_minimal_user_json(),
+                "content": body.get("content") or "",
+                "timestamp": discord.utils.utcnow().isoformat(),
+                "edited_timestamp": None,
+                "tts": False,
+                "mention_everyone": False,
+                "mentions": [],
+                "mention_roles": [],
+                "attachments": [],
+                "embeds": body.get("embeds") or [],
+                "components": body.get("components") or [],
+                "pinned": False,
+                "type": 0,
+            }
+        if method == "POST" and parts[0] == "guilds" and parts[-1] == "channels":
+            return {
+                "id": str(self.snowflake()),
+                "guild_id": parts[1],
+                "type": body.get("type", 0),
+                "name": body.get("name"),
+                "topic": body.get("topic"),
+                "parent_id": body.get("parent_id"),
+                "permission_overwrites": body.get("permission_overwrites") or [],
+                "position": 0,
+                "nsfw": False,
+            }
+        return None
+
+async def load_cogs(bot):
+    """
+    Load every cog the way bot.py does on ready.
+    """
+    for filename in sorted(os.listdir("cogs")):
+        if filename.endswith('.py') and filename != '__init__.py':
+            try:
+                await bot.load_extension(f'cogs.{filename[:-3]}')
+                print(f'📦 Loaded cog: {filename[:-3]}')
+            except Exception as e:
+                print(f'❌ Failed to load cog {filename[:-3]}: {e}')
+
+async def replay(path, tail=0.0):
+    """
+    Feed a recorded log into a fresh bot running the real cogs.
+    Dispatches keep their recorded spacing in loop time, which the VirtualTimeLoop compresses.
+    """
+    intents = discord.Intents.default()
+    intents.message_content = MESSAGE_CONTENT_INTENT
+    intents.members = True
+    intents.guilds = True
+
+    # No gateway is connected, so skip member chunking and wait briefly for guilds
+    bot = commands.Bot(
+        command_prefix=BOT_PREFIX,
+        intents=intents,
+        help_command=None,
+        chunk_guilds_at_startup=False,
+        guild_ready_timeout=0.5
+    )
+    stand_in = RestStandIn(bot)
+
+    dispatches = []
+    for record in read_log(path):
+        if record[0] == "D":
+            dispatches.append(record)
+        elif record[0] == "R":
+            _, _, method, route, _, status, response = record
+            stand_in.add(method, route, status, response)
+
+    if not dispatches:
+        print(f"❌ No gateway events found in {path}")
+        return
+
+    with tempfile.TemporaryDirectory(prefix="replay-") as state_dir:
+        await run_dispatches(bot, stand_in, dispatches, state_dir, tail)
+
+async def run_dispatches(bot, stand_in, dispatches, state_dir, tail):
+    """
+    Run the cogs against the dispatches, with their state files in state_dir.
+    """
+    # Cogs read these when they're imported; keep replayed members and tickets out of the live files
+    config.WELCOME_DEDUPE_PATH = os.path.join(state_dir, "welcome_dedupe.json")
+    config.TICKET_EVENTS_PATH = os.path.join(state_dir, "ticket_events.jsonl")
+
+    cogs_loaded = asyncio.Event()
+
+    @bot.event
+    async def on_ready():
+        await load_cogs(bot)
+        cogs_loaded.set()
+
+    loop = asyncio.get_running_loop()
+    dispatched = failed = 0
+    real_started = time.monotonic()
+
+    async with bot:
+        stand_in.install()
+        first = dispatches[0][1]
+        started = loop.time()
+        seen_ready = False
+
+        for _, timestamp, event, data in dispatches:
+            delay = started + (timestamp - first) - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            # Cogs load in on_ready, partly in threads the virtual clock doesn't wait for;
+            # hold later events until they're loaded, keeping the recorded spacing after that
+            if seen_ready and event not in ("READY", "GUILD_CREATE") and not cogs_loaded.is_set():
+                waited = loop.time()
+                await cogs_loaded.wait()
+                started += loop.time() - waited
+            seen_ready = seen_ready or event == "READY"
+
+            parser = bot._connection.parsers.get(event)
+            if parser is None:
+                continue
+            try:
+                parser(data)
+                dispatched += 1
+            except Exception as e:
+                failed += 1
+                print(f"⚠️ Failed to replay {event}: {e}")
+
+        # Let pending timers (e.g. delayed welcome DMs) run past the end of the log
+        await asyncio.sleep(tail)
+        await loop.drain()
+        virtual_elapsed = loop.time() - started
+
+    pending = stand_in.served + sum(len(queue) for queue in stand_in.responses.values())
+    print(f"✅ Replayed {dispatched} events ({failed} failed) covering {virtual_elapsed:.0f}s in {time.monotonic() - real_started:.2f}s")
+    print(f"📡 Served {stand_in.served}/{pending} recorded REST responses")
+    for route, count in stand_in.synthesized.most_common():
+        print(f"   synthesized {count}x {route}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded event log against the bot's cogs.")
+    parser.add_argument("path", help="gzip JSONL log written by EventRecorder")
+    parser.add_argument("--speed", type=float, default=1.0, help="virtual time multiplier (default: 1x)")
+    parser.add_argument("--fast", action="store_true", help="skip idle time entirely")
+    parser.add_argument("--tail", type=float, default=0.0, help="virtual seconds to keep running after the last event")
+    args = parser.parse_args()
+
+    loop = VirtualTimeLoop(VirtualClock(math.inf if args.fast else args.speed))
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(replay(args.path, args.tail))
+    finally:
+        # Cancel timers still pending past the end of the replay
+        pending = asyncio.all_tasks(loop)
+        if pending:
+            print(f"⏹️ Cancelled {len(pending)} tasks still waiting at the end (e.g. timers past --tail)")
+        for task in pending:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+import asyncio
+import collections
+import csv
+import json
+import os
+import tempfile
+import time
+
+# Rolling windows reported by /ticketstats, in hours
+SLA_WINDOWS = (("24h", 24), ("7 days", 7 * 24), ("30 days", 30 * 24))
+SLA_HORIZON_HOURS = 30 * 24
+SLA_METRICS = ("first_response", "resolution")
+
+class TDigest:
+    """
+    Merging t-digest: a compact streaming quantile sketch (a few hundred centroids at most).
+    Accurate at the tails (p99) and mergeable, so hourly digests combine into any window.
+    """
+
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.centroids = []  # Sorted [mean, weight]
+        self.buffer = []
+        self.count = 0
+
+    def add(self, value, weight=1):
+        self.buffer.append([value, weight])
+        self.count += weight
+        if len(self.buffer) >= self.compression * 2:
+            self.compress()
+
+    def merge(self, other):
+        self.buffer.extend([mean, weight] for mean, weight in other.centroids + other.buffer)
+        self.count += other.count
+        self.compress()
+
+    def compress(self):
+        """
+        Fold buffered points into centroids, keeping centroids small near the tails.
+        """
+        if not self.buffer:
+            return
+        points = sorted(self.centroids + self.buffer)
+        self.buffer = []
+        total = self.count
+        merged = []
+        seen = 0  # Weight before the last merged centroid
+        for mean, weight in points:
+            if merged:
+                last_mean, last_weight = merged[-1]
+                q = (seen + (last_weight + weight) / 2) / total
+                if last_weight + weight <= max(1, 4 * total * q * (1 - q) / self.compression):
+                    new_weight = last_weight + weight
+                    merged[-1] = [last_mean + (mean - last_mean) * weight / new_weight, new_weight]
+                    continue
+                seen += last_weight
+            merged.append([mean, weight])
+        self.centroids = merged
+
+    def quantile(self, q):
+        """
+        Estimate the q-th quantile (0..1), interpolating between centroid centers.
+        """
+        self.compress()
+        if not self.centroids:
+            return None
+        target = q * self.count
+        cumulative = 0
+        previous_center = previous_mean = None
+        for mean, weight in self.centroids:
+            center = cumulative + weight / 2
+            if target <= center:
+                if previous_center is None:
+                    return mean
+                ratio = (target - previous_center) / (center - previous_center)
+                return previous_mean + (mean - previous_mean) * ratio
+            previous_center, previous_mean = center, mean
+            cumulative += weight
+        return self.centroids[-1][0]
+
+class TicketEventLog:
+    """
+    Append-only JSONL log of ticket lifecycle events, written in batches off the event loop.
+    """
+
+    def __init__(self, path, flush_delay):
+        self.path = path
+        self.flush_delay = flush_delay
+        self.buffer = []
+        self.flush_task = None
+
+    def append(self, record):
+        self.buffer.append(json.dumps(record, separators=(",", ":")))
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(self.flush_delay)
+        await self.flush()
+
+    async def flush(self):
+        if not self.buffer:
+            return
+        lines, self.buffer = self.buffer, []
+        try:
+            await asyncio.to_thread(self._write, lines)
+        except OSError as e:
+            print(f"Failed to write ticket events to {self.path}: {e}")
+
+    def _write(self, lines):
+        with open(self.path, "a", encoding="utf-8") as log_file:
+            log_file.write("\n".join(lines) + "\n")
+
+    def stream(self, since=0):
+        """
+        Yield records one line at a time, so the log is never fully in memory.
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as log_file:
+                for line in log_file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Skip a line truncated by a crash
+                    if record["t"] >= since:
+                        yield record
+        except FileNotFoundError:
+            return
+
+    def stream_from(self, offset=0):
+        """
+        Yield (end_offset, record) for complete lines after a byte offset, one line at a time.
+        A line still being written by another instance is left for the next read.
+        """
+        try:
+            with open(self.path, "rb") as log_file:
+                log_file.seek(offset)
+                for line in log_file:
+                    if not line.endswith(b"\n"):
+                        return
+                    offset += len(line)
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Skip a line truncated by a crash
+                    yield offset, record
+        except FileNotFoundError:
+            return
+
+    def export(self, file_format, since=0):
+        """
+        Stream matching records into a temporary CSV or JSONL file and return its path.
+        Blocking; run in a thread.
+        """
+        handle, path = tempfile.mkstemp(suffix=f".{file_format}")
+        with os.fdopen(handle, "w", encoding="utf-8", newline="") as export_file:
+            if file_format == "csv":
+                writer = csv.writer(export_file)
+                writer.writerow(["time", "event", "channel_id", "user_id", "seconds"])
+                for record in self.stream(since):
+                    stamp = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(record["t"]))
+                    writer.writerow([stamp, record["event"], record["channel"], record.get("user", ""), record.get("after", "")])
+            else:
+                for record in self.stream(since):
+                    export_file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        return path
+
+class TicketLifecycle:
+    """
+    Track open tickets and keep streaming first-response and resolution percentiles.
+    Memory is bounded by open tickets plus one small digest per hour of the horizon.
+    `clock` returns the current time in seconds since the epoch.
+    """
+
+    def __init__(self, log, clock=time.time):
+        self.log = log
+        self.clock = clock
+        self.open = {}  # {channel_id: (opened_at, user_id)}
+        self.awaiting_response = set()  # Open channels without a support reply yet
+        self.digests = {metric: collections.OrderedDict() for metric in SLA_METRICS}  # {metric: {hour: TDigest}}
+        self.log_offset = 0  # Bytes of the log already applied
+
+    def load(self):
+        """
+        Apply events appended to the log since the last load (the whole log the first time).
+        Blocking; run in a thread.
+        """
+        count = 0
+        for offset, record in self.log.stream_from(self.log_offset):
+            self.apply(record)
+            self.log_offset = offset
+            count += 1
+        print(f"Loaded {count} ticket events ({len(self.open)} open tickets)")
+
+    def record(self, event, channel_id, user_id=None):
+        """
+        Append a lifecycle event ("opened", "first_response", "closed", "evicted", "deleted") and update the stats.
+        """
+        now = round(self.clock(), 3)
+        record = {"t": now, "event": event, "channel": channel_id}
+        if user_id is not None:
+            record["user"] = user_id
+        if event in ("first_response", "closed") and channel_id in self.open:
+            record["after"] = round(now - self.open[channel_id][0], 3)
+        self.log.append(record)
+        self.apply(record)
+
+    def apply(self, record):
+        event, channel_id = record["event"], record["channel"]
+        if event == "opened":
+            self.open[channel_id] = (record["t"], record.get("user"))
+            self.awaiting_response.add(channel_id)
+        elif event == "first_response":
+            self.awaiting_response.discard(channel_id)
+            if "after" in record:
+                self.observe("first_response", record["t"], record["after"])
+        elif event == "closed":
+            self.open.pop(channel_id, None)
+            self.awaiting_response.discard(channel_id)
+            if "after" in record:
+                self.observe("resolution", record["t"], record["after"])
+        elif event in ("evicted", "deleted"):
+            # Channel is gone without a close; it no longer counts as open
+            self.open.pop(channel_id, None)
+            self.awaiting_response.discard(channel_id)
+
+    def needs_first_response(self, channel_id, author_id):
+        """
+        Return True if a message by author_id would be the first support reply in the channel.
+        """
+        return channel_id in self.awaiting_response and self.open[channel_id][1] != author_id
+
+    def observe(self, metric, timestamp, value):
+        hour = int(timestamp // 3600)
+        buckets = self.digests[metric]
+        if hour not in buckets:
+            buckets[hour] = TDigest()
+            # Drop hours that fell out of the longest window
+            while buckets and next(iter(buckets)) <= hour - SLA_HORIZON_HOURS:
+                buckets.popitem(last=False)
+        buckets[hour].add(value)
+
+    def percentiles(self, metric, hours, quantiles=(0.5, 0.9, 0.99)):
+        """
+        Return (count, [values]) for a metric over the last `hours` hours.
+        """
+        first_hour = int(self.clock() // 3600) - hours
+        window = TDigest()
+        for hour, digest in self.digests[metric].items():
+            if hour > first_hour:
+                window.merge(digest)
+        return window.count, [window.quantile(q) for q in quantiles]
+
+def format_duration(seconds):
+    """
+    Format a duration compactly, e.g. "45s", "12m", "3h 05m", "2d 4h".
+    """
+    if seconds is None:
+        return "—"
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m"
+    if seconds < 86400:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    return f"{seconds // 86400}d {seconds % 86400 // 3600}h"
@@ -0,0 +1,419 @@
+"""
+HTML transcripts of ticket channels, rendered off the event loop in a process pool.
+
+Benchmark: python -m utils.transcript --benchmark 10000
+"""
+import discord
+import asyncio
+import argparse
+import base64
+import collections
+import gzip
+import hashlib
+import html
+import io
+import mimetypes
+import multiprocessing
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from config import LOG_CHANNEL_ID, TRANSCRIPT_WORKERS
+
+# Fetched avatars and emoji kept in the bot process between transcripts
+ASSET_CACHE_SIZE = 512
+# Concurrent CDN downloads per transcript
+ASSET_FETCH_CONCURRENCY = 8
+# Width of attachment thumbnails requested from the media proxy
+THUMBNAIL_WIDTH = 320
+
+CUSTOM_EMOJI = re.compile(r"<(a?):(\w+):(\d+)>")
+
+# Per-worker LRU of encoded asset CSS rules, kept across jobs
+_asset_rules = collections.OrderedDict()
+
+STYLE = """
+body{background:#313338;color:#dbdee1;font:15px/1.4 "gg sans","Helvetica Neue",Arial,sans-serif;margin:0;padding:16px}
+h1{font-size:18px;color:#f2f3f5;border-bottom:1px solid #3f4147;padding-bottom:8px}
+.msg{display:flex;gap:12px;padding:4px 0}
+.av{width:40px;height:40px;border-radius:50%;flex:none;background:#5865f2 center/cover}
+.head{color:#f2f3f5;font-weight:600}.bot{background:#5865f2;border-radius:3px;font-size:10px;padding:0 4px;margin-left:4px}
+.time{color:#949ba4;font-size:12px;margin-left:6px}.body{white-space:pre-wrap;word-wrap:break-word}
+.mention{background:#5865f24d;color:#c9cdfb;border-radius:3px;padding:0 2px}
+.emoji{display:inline-block;width:22px;height:22px;vertical-align:bottom;background:center/contain no-repeat}
+code{background:#2b2d31;border-radius:3px;padding:0 3px}pre{background:#2b2d31;border-radius:4px;padding:8px;white-space:pre-wrap}
+.spoiler{background:#1e1f22;color:transparent}.spoiler:hover{color:inherit}
+blockquote{border-left:4px solid #4e5058;margin:0;padding-left:8px}
+.embed{border-left:4px solid #1e1f22;background:#2b2d31;border-radius:4px;padding:8px 12px;margin-top:4px;max-width:520px}
+.embed .title{font-weight:600;color:#f2f3f5}.embed .field{margin-top:4px}.embed .field b{display:block}
+.att img{max-width:320px;border-radius:4px;margin-top:4px;display:block}.att a{color:#00a8fc}
+"""
+
+def _asset_rule(key, mime, data):
+    """
+    Return (css_class, css_rule) for an image asset, encoding it only once per worker.
+    """
+    if key in _asset_rules:
+        _asset_rules.move_to_end(key)
+        return _asset_rules[key]
+    css_class = "i" + hashlib.md5(key.encode("utf-8")).hexdigest()[:10]
+    encoded = base64.b64encode(data).decode("ascii")
+    _asset_rules[key] = (css_class, f".{css_class}{{background-image:url(data:{mime};base64,{encoded})}}")
+    if len(_asset_rules) > ASSET_CACHE_SIZE:
+        _asset_rules.popitem(last=False)
+    return _asset_rules[key]
+
+def _format_inline(text, names, used):
+    """
+    Render Discord inline markdown on already-escaped text.
+    """
+    parts = re.split(r'(`[^`\n]+`|https?://[^\s<"]+)', text)
+    for i, part in enumerate(parts):
+        if not part:
+            continue
+        # Odd indices are the captured code spans and links; even ones are plain text
+        if i % 2:
+            if part.startswith("`"):
+                parts[i] = f"<code>{part[1:-1]}</code>"
+            else:
+                parts[i] = f'<a href="{part}">{part}</a>'
+            continue
+        part = re.sub(r"\*\*(.+?)\*\*", r"<b>\1</b>", part)
+        part = re.sub(r"__(.+?)__", r"<u>\1</u>", part)
+        part = re.sub(r"(?<![\w*])\*(?!\s)(.+?)\*", r"<i>\1</i>", part)
+        part = re.sub(r"(?<!\w)_(.+?)_(?!\w)", r"<i>\1</i>", part)
+        part = re.sub(r"~~(.+?)~~", r"<s>\1</s>", part)
+        part = re.sub(r"\|\|(.+?)\|\|", r'<span class="spoiler">\1</span>', part)
+        part = re.sub(
+            r"&lt;(@!?|@&amp;|#)(\d+)&gt;",
+            lambda m: _format_mention(m.group(1), m.group(2), names),
+            part
+        )
+        part = re.sub(
+            r"&lt;a?:(\w+):(\d+)&gt;",
+            lambda m: _format_emoji(m.group(1), m.group(2), used),
+            part
+        )
+        parts[i] = part
+    return "".join(parts)
+
+def _format_mention(kind, target, names):
+    prefix = "#" if kind == "#" else "@"
+    key = ("@&" if kind == "@&amp;" else prefix) + target
+    name = html.escape(names.get(key, "unknown"))
+    return f'<span class="mention">{prefix}{name}</span>'
+
+def _format_emoji(name, emoji_id, used):
+    css_class = used.get(f"emoji:{emoji_id}")
+    if css_class is None:
+        return f":{name}:"
+    return f'<span class="emoji {css_class}" title=":{name}:"></span>'
+
+def _format_content(content, names, used):
+    """
+    Render message content: code blocks, block quotes, then inline markdown.
+    """
+    blocks = re.split(r"```(?:[\w+-]*\n)?(.*?)```", html.escape(content, quote=False), flags=re.DOTALL)
+    out = []
+    for i, block in enumerate(blocks):
+        if i % 2:
+            out.append(f"<pre>{block}</pre>")
+            continue
+        lines = []
+        for line in block.split("\n"):
+            if line.startswith("&gt; "):
+                lines.append(f"<blockquote>{_format_inline(line[5:], names, used)}</blockquote>")
+            else:
+                lines.append(_format_inline(line, names, used))
+        out.append("\n".join(lines))
+    return "".join(out)
+
+def _format_embed(embed, names, used):
+    color = embed.get("color")
+    style = f' style="border-color:#{color:06x}"' if color else ""
+    parts = [f'<div class="embed"{style}>']
+    if embed.get("title"):
+        parts.append(f'<div class="title">{html.escape(embed["title"])}</div>')
+    if embed.get("description"):
+        parts.append(f'<div>{_format_content(embed["description"], names, used)}</div>')
+    for field in embed.get("fields", []):
+        name = html.escape(field.get("name", ""))
+        value = _format_content(field.get("value", ""), names, used)
+        parts.append(f'<div class="field"><b>{name}</b>{value}</div>')
+    parts.append("</div>")
+    return "".join(parts)
+
+def render_transcript(title, authors, messages, names, assets):
+    """
+    Render a serialized message stream into a single self-contained HTML document.
+    Runs in a worker process; all arguments are plain picklable data.
+
+    authors: {author_id: (display_name, avatar_key, is_bot)}
+    messages: [(author_id, timestamp, content, embeds, attachments)]
+    attachments: [(filename, url, thumbnail_key)]
+    names: {"@id" | "@&id" | "#id": name} for mentions
+    assets: {key: (mime, bytes)} for avatars, emoji and thumbnails
+    """
+    # Avatars and emoji repeat across messages and tickets; attachments are inlined once below
+    rules = []
+    used = {}
+    for key, (mime, data) in assets.items():
+        if not key.startswith("att:"):
+            used[key], rule = _asset_rule(key, mime, data)
+            rules.append(rule)
+
+    rows = []
+    for author_id, timestamp, content, embeds, attachments in messages:
+        name, avatar_key, is_bot = authors.get(author_id, ("Unknown", None, False))
+        avatar_class = used.get(avatar_key, "")
+        badge = '<span class="bot">BOT</span>' if is_bot else ""
+        stamp = time.strftime("%Y-%m-%d %H:%M", time.gmtime(timestamp))
+
+        body = [_format_content(content, names, used)] if content else []
+        body.extend(_format_embed(embed, names, used) for embed in embeds)
+        for filename, url, thumbnail_key in attachments:
+            filename = html.escape(filename)
+            if thumbnail_key in assets:
+                mime, data = assets[thumbnail_key]
+                encoded = base64.b64encode(data).decode("ascii")
+                body.append(f'<div class="att"><a href="{html.escape(url)}"><img alt="{filename}" src="data:{mime};base64,{encoded}"></a></div>')
+            else:
+                body.append(f'<div class="att"><a href="{html.escape(url)}">📎 {filename}</a></div>')
+
+        rows.append(
+            f'<div class="msg"><div class="av {avatar_class}"></div><div>'
+            f'<span class="head">{html.escape(name)}</span>{badge}<span class="time">{stamp} UTC</span>'
+            f'<div class="body">{"".join(body)}</div></div></div>'
+        )
+
+    stylesheet = STYLE + "\n".join(rules)
+    return (
+        f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{html.escape(title)}</title>'
+        f'<style>{stylesheet}</style></head><body><h1>{html.escape(title)} — {len(messages)} messages</h1>'
+        + "\n".join(rows)
+        + "</body></html>"
+    ).encode("utf-8")
+
+class TranscriptRenderer:
+    """
+    Collect a ticket channel's history and render it to HTML in a process pool,
+    so long conversations don't block the event loop.
+    """
+
+    def __init__(self, bot, workers=TRANSCRIPT_WORKERS):
+        self.bot = bot
+        # Spawned workers don't inherit the bot's sockets and threads
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        self.assets = collections.OrderedDict()  # LRU of fetched avatars and emoji
+        self.tasks = set()  # Store upload tasks so they don't get garbage collected
+
+    async def fetch_asset(self, key, url, cache=True):
+        """
+        Download an image from the CDN, using the LRU cache for avatars and emoji.
+        """
+        if key in self.assets:
+            self.assets.move_to_end(key)
+            return self.assets[key]
+        try:
+            data = await self.bot.http.get_from_cdn(url)
+        except Exception as e:
+            print(f"Could not fetch transcript asset {url}: {e}")
+            return None
+
+        mime = mimetypes.guess_type(url.split("?")[0])[0] or "image/png"
+        asset = (mime, data)
+        if cache:
+            self.assets[key] = asset
+            if len(self.assets) > ASSET_CACHE_SIZE:
+                self.assets.popitem(last=False)
+        return asset
+
+    async def collect(self, channel):
+        """
+        Read the channel history into the compact stream render_transcript expects.
+        Must run before the channel is deleted.
+        """
+        authors = {}
+        messages = []
+        names = {}
+        wanted = {}  # asset key -> (url, cacheable)
+
+        async for message in channel.history(limit=None, oldest_first=True):
+            author = message.author
+            if author.id not in authors:
+                avatar = author.display_avatar.with_size(64)
+                avatar_key = f"avatar:{avatar.key}"
+                authors[author.id] = (author.display_name, avatar_key, author.bot)
+                wanted[avatar_key] = (avatar.url, True)
+
+            for user in message.mentions:
+                names[f"@{user.id}"] = user.display_name
+            for role in message.role_mentions:
+                names[f"@&{role.id}"] = role.name
+            for mentioned in message.channel_mentions:
+                names[f"#{mentioned.id}"] = mentioned.name
+
+            texts = [message.content] + [embed.description or "" for embed in message.embeds]
+            for text in texts:
+                for animated, _, emoji_id in CUSTOM_EMOJI.findall(text):
+                    extension = "gif" if animated else "png"
+                    wanted[f"emoji:{emoji_id}"] = (f"https://cdn.discordapp.com/emojis/{emoji_id}.{extension}", True)
+
+            attachments = []
+            for attachment in message.attachments:
+                thumbnail_key = None
+                if (attachment.content_type or "").startswith("image/"):
+                    thumbnail_key = f"att:{attachment.id}"
+                    separator = "&" if "?" in attachment.proxy_url else "?"
+                    wanted[thumbnail_key] = (f"{attachment.proxy_url}{separator}width={THUMBNAIL_WIDTH}", False)
+                attachments.append((attachment.filename, attachment.url, thumbnail_key))
+
+            messages.append((
+                author.id,
+                message.created_at.timestamp(),
+                message.content,
+                [embed.to_dict() for embed in message.embeds],
+                attachments
+            ))
+
+        semaphore = asyncio.Semaphore(ASSET_FETCH_CONCURRENCY)
+
+        async def fetch(key, url, cache):
+            async with semaphore:
+                return key, await self.fetch_asset(key, url, cache)
+
+        fetched = await asyncio.gather(*(fetch(key, url, cache) for key, (url, cache) in wanted.items()))
+        assets = {key: asset for key, asset in fetched if asset}
+        return f"#{channel.name}", authors, messages, names, assets
+
+    async def render(self, job):
+        """
+        Render a collected job in the process pool.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, render_transcript, *job)
+
+    def publish(self, job):
+        """
+        Render and upload a transcript to the log channel in the background.
+        """
+        task = asyncio.create_task(self.render_and_upload(job))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def render_and_upload(self, job):
+        title, messages = job[0], job[2]
+        log_channel = self.bot.get_channel(LOG_CHANNEL_ID)
+        if not log_channel:
+            print(f"Log channel {LOG_CHANNEL_ID} not found, transcript of {title} not uploaded")
+            return
+        try:
+            document, filename, note = await self.fit_upload(job, log_channel.guild.filesize_limit)
+            if document is None:
+                print(f"Transcript of {title} is too large to upload ({note})")
+                await log_channel.send(f"🎫 Transcript du ticket {title} trop volumineux pour être envoyé ({note})")
+                return
+            await log_channel.send(
+                f"🎫 Transcript du ticket {title} ({len(messages)} messages){note}",
+                file=discord.File(io.BytesIO(document), filename=filename)
+            )
+            print(f"Uploaded transcript of {title} ({len(document)} bytes)")
+        except Exception as e:
+            print(f"Error rendering transcript of {title}: {e}")
+            try:
+                await log_channel.send(f"🎫 Erreur lors de l'envoi du transcript du ticket {title}: {e}")
+            except Exception as e:
+                print(f"Failed to send log message: {e}")
+
+    async def fit_upload(self, job, size_limit):
+        """
+        Render the transcript so it fits the upload limit: as is, then without inlined
+        image thumbnails, then gzipped. Returns (document, filename, note), or (None, None, reason).
+        """
+        title = job[0]
+        filename = f"transcript-{title[1:]}.html"
+        document = await self.render(job)
+        note = ""
+        if len(document) > size_limit:
+            # Thumbnails are inlined as base64 and dominate large transcripts; keep the links
+            assets = {key: asset for key, asset in job[4].items() if not key.startswith("att:")}
+            document = await self.render((*job[:4], assets))
+            note = " — sans aperçus d'images"
+        if len(document) > size_limit:
+            document = await asyncio.to_thread(gzip.compress, document)
+            filename += ".gz"
+            note += " — compressé"
+        if len(document) > size_limit:
+            return None, None, f"{len(document) // 1024} KiB compressé, limite {size_limit // 1024} KiB"
+        return document, filename, note
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+def _benchmark_job(count):
+    """
+    Build a synthetic ticket with `count` messages from a handful of authors.
+    """
+    avatar = b"\x89PNG\r\n\x1a\n" + bytes(2048)
+    authors = {i: (f"user{i}", f"avatar:{i}", i == 0) for i in range(20)}
+    assets = {f"avatar:{i}": ("image/png", avatar) for i in range(20)}
+    assets["emoji:1"] = ("image/png", avatar)
+    names = {f"@{i}": f"user{i}" for i in range(20)}
+    content = (
+        "Hey <@3>, **the export** fails with `ERR_42` when I click _generate_ :\n"
+        "> see https://thumblab.app/help_page\n```py\nprint('hi')\n```<:ok:1> ||spoiler||"
+    )
+    embed = {"title": "Status", "description": "All *good*", "color": 0x33D26D, "fields": [{"name": "Plan", "value": "Pro"}]}
+    messages = [
+        (i % 20, 1700000000 + i * 30, content, [embed] if i % 10 == 0 else [], [])
+        for i in range(count)
+    ]
+    return "#ticket-benchmark", authors, messages, names, assets
+
+async def _benchmark(count):
+    """
+    Compare event loop stalls while rendering inline versus in the process pool.
+    """
+    job = _benchmark_job(count)
+    executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    loop = asyncio.get_running_loop()
+    # Start the worker before measuring
+    await loop.run_in_executor(executor, render_transcript, "warmup", {}, [], {}, {})
+
+    async def measure(render):
+        worst = 0.0
+        done = asyncio.Event()
+
+        async def ticker():
+            nonlocal worst
+            while not done.is_set():
+                before = loop.time()
+                await asyncio.sleep(0.01)
+                worst = max(worst, loop.time() - before - 0.01)
+
+        ticking = asyncio.create_task(ticker())
+        await asyncio.sleep(0.05)
+        started = time.perf_counter()
+        document = await render()
+        elapsed = time.perf_counter() - started
+        done.set()
+        await ticking
+        return elapsed, worst, len(document)
+
+    async def inline():
+        return render_transcript(*job)
+
+    async def pooled():
+        return await loop.run_in_executor(executor, render_transcript, *job)
+
+    for label, render in (("inline", inline), ("process pool", pooled)):
+        elapsed, worst, size = await measure(render)
+        print(f"{label:>12}: {count} messages in {elapsed:.2f}s, {size / 1024:.0f} KiB, worst loop stall {worst * 1000:.0f}ms")
+    executor.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark transcript rendering.")
+    parser.add_argument("--benchmark", type=int, default=10000, metavar="MESSAGES")
+    asyncio.run(_benchmark(parser.parse_args().benchmark))
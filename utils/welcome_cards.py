@@ -0,0 +1,370 @@
+"""
+Image welcome cards rendered in a thread pool, with cached avatars and join-wave coalescing.
+
+Benchmark: python -m utils.welcome_cards --benchmark 500
+"""
+import discord
+import asyncio
+import argparse
+import collections
+import functools
+import hashlib
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    WELCOME_CARD_BACKGROUND, WELCOME_CARD_FONT, WELCOME_CARD_WORKERS,
+    WELCOME_CARD_COALESCE_WINDOW, WELCOME_CARD_CACHE_SIZE, PUBLIC_WELCOME_MESSAGE
+)
+
+try:
+    from PIL import Image, ImageDraw, ImageFont, ImageOps
+except ImportError:
+    Image = None  # Pillow is optional; the welcome cog falls back to text messages
+
+CARD_SIZE = (1024, 360)
+AVATAR_SIZE = 220
+COLLAGE_AVATAR_SIZE = 96
+COLLAGE_MAX_AVATARS = 16
+COLLAGE_MAX_MENTIONS = 50
+# Concurrent avatar downloads across all cards
+AVATAR_FETCH_CONCURRENCY = 4
+
+def cards_available():
+    """Return True if Pillow is installed."""
+    return Image is not None
+
+@functools.lru_cache(maxsize=8)
+def _font(size):
+    if WELCOME_CARD_FONT:
+        try:
+            return ImageFont.truetype(WELCOME_CARD_FONT, size)
+        except OSError as e:
+            print(f"Could not load welcome card font {WELCOME_CARD_FONT}: {e}")
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:
+        return ImageFont.load_default()  # Pillow < 10.1 has a single bitmap size
+
+def _fit_text(draw, text, size, max_width):
+    """
+    Shrink the font, then truncate, until text fits in max_width.
+    """
+    while size > 24 and draw.textlength(text, font=_font(size)) > max_width:
+        size -= 4
+    font = _font(size)
+    if draw.textlength(text, font=font) > max_width:
+        while text and draw.textlength(text + "…", font=font) > max_width:
+            text = text[:-1]
+        text += "…"
+    return text, font
+
+def prepare_avatar(data, size):
+    """
+    Decode avatar bytes into a circular RGBA image. Runs in the thread pool.
+    """
+    avatar = ImageOps.fit(Image.open(io.BytesIO(data)).convert("RGBA"), (size, size))
+    mask = Image.new("L", (size, size), 0)
+    ImageDraw.Draw(mask).ellipse((0, 0, size - 1, size - 1), fill=255)
+    avatar.putalpha(mask)
+    return avatar
+
+class WelcomeCardRenderer:
+    """
+    Render and send welcome cards without blocking the event loop.
+    Avatars are fetched with bounded concurrency through the bot's HTTP session and
+    kept in an LRU cache by avatar hash; drawing happens in a thread pool.
+    During a join wave, joins inside the coalescing window share one collage card.
+    """
+
+    def __init__(self, bot, workers=WELCOME_CARD_WORKERS):
+        self.bot = bot
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="welcome-card")
+        self.fetch_semaphore = asyncio.Semaphore(AVATAR_FETCH_CONCURRENCY)
+        self.avatars = collections.OrderedDict()  # {(avatar hash, size): circular image}, LRU
+        self.fetching = {}  # {(avatar hash, size): task} for downloads in flight
+        self.backgrounds = {}  # {template sha256: image}
+        self.background_hashes = {}  # {(path, mtime, size): template sha256}
+        self.background_lock = threading.Lock()
+        self.pending = []  # [(member, channel)] waiting for the next collage
+        self.sending = []  # The batch flush_pending is sending right now
+        self.window_ends = 0.0
+        self.flush_task = None
+        self.tasks = set()  # Store send tasks so they don't get garbage collected
+        self.cards_sent = 0
+        self.collages_sent = 0
+
+    async def close(self):
+        """
+        Finish cards already being rendered, welcome members still waiting for a collage
+        with one plain text message, then stop the thread pool.
+        """
+        if self.flush_task and not self.flush_task.done():
+            self.flush_task.cancel()
+            try:
+                await self.flush_task
+            except asyncio.CancelledError:
+                pass
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+        batch, self.sending, self.pending = self.sending + self.pending, [], []
+        if batch:
+            channel = batch[0][1]
+            try:
+                await channel.send(self.batch_text([member for member, _ in batch]))
+                print(f"Sent a text welcome for {len(batch)} members still waiting for a card")
+            except Exception as e:
+                print(f"Error sending welcome message: {e}")
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    # Coalescing
+
+    def submit(self, member, channel):
+        """
+        Queue a welcome card. The first join in a quiet period gets its own card right away;
+        later joins inside the window are batched into one collage when it closes.
+        """
+        now = asyncio.get_running_loop().time()
+        if now >= self.window_ends and not self.pending:
+            self.window_ends = now + WELCOME_CARD_COALESCE_WINDOW
+            task = asyncio.create_task(self.send_card(member, channel))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+            return
+
+        self.pending.append((member, channel))
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self.flush_pending())
+
+    async def flush_pending(self):
+        loop = asyncio.get_running_loop()
+        while self.pending:
+            await asyncio.sleep(max(0, self.window_ends - loop.time()))
+            batch, self.pending = self.pending, []
+            self.window_ends = loop.time() + WELCOME_CARD_COALESCE_WINDOW
+            # Kept until sent, so close() can still welcome them if it cancels this task
+            self.sending = batch
+            if len(batch) == 1:
+                await self.send_card(*batch[0])
+            else:
+                await self.send_collage(batch)
+            self.sending = []
+
+    # Sending
+
+    async def send_card(self, member, channel):
+        text = PUBLIC_WELCOME_MESSAGE.format(
+            user_mention=member.mention,
+            user_name=member.display_name
+        )
+        try:
+            avatar = await self.get_avatar(member.display_avatar, AVATAR_SIZE)
+            loop = asyncio.get_running_loop()
+            image = await loop.run_in_executor(
+                self.executor, self.render_card, member.display_name, member.guild.member_count, avatar
+            )
+            await channel.send(text, file=discord.File(io.BytesIO(image), filename="welcome.jpg"))
+            self.cards_sent += 1
+        except discord.Forbidden:
+            print(f"Missing permissions to send messages in welcome channel {channel.id}")
+        except Exception as e:
+            print(f"Error sending welcome card for {member.name}, falling back to text: {e}")
+            try:
+                await channel.send(text)
+            except Exception as e:
+                print(f"Error sending welcome message: {e}")
+
+    @staticmethod
+    def batch_text(members):
+        """
+        PUBLIC_WELCOME_MESSAGE for several members at once, with the mention list capped.
+        """
+        mentions = ", ".join(member.mention for member in members[:COLLAGE_MAX_MENTIONS])
+        names = ", ".join(member.display_name for member in members[:COLLAGE_MAX_MENTIONS])
+        if len(members) > COLLAGE_MAX_MENTIONS:
+            others = len(members) - COLLAGE_MAX_MENTIONS
+            mentions += f" and {others} others"
+            names += f" and {others} others"
+        return PUBLIC_WELCOME_MESSAGE.format(user_mention=mentions, user_name=names)
+
+    async def send_collage(self, batch):
+        members = [member for member, _ in batch]
+        channel = batch[0][1]
+        text = self.batch_text(members)
+
+        try:
+            shown = members[:COLLAGE_MAX_AVATARS]
+            avatars = await asyncio.gather(*(
+                self.get_avatar(member.display_avatar, COLLAGE_AVATAR_SIZE) for member in shown
+            ))
+            loop = asyncio.get_running_loop()
+            image = await loop.run_in_executor(
+                self.executor, self.render_collage, len(members), members[-1].guild.member_count, avatars
+            )
+            await channel.send(text, file=discord.File(io.BytesIO(image), filename="welcome.jpg"))
+            self.collages_sent += 1
+            print(f"Sent one welcome collage for {len(members)} members")
+        except discord.Forbidden:
+            print(f"Missing permissions to send messages in welcome channel {channel.id}")
+        except Exception as e:
+            print(f"Error sending welcome collage, falling back to text: {e}")
+            try:
+                await channel.send(text)
+            except Exception as e:
+                print(f"Error sending welcome message: {e}")
+
+    # Assets
+
+    async def get_avatar(self, asset, size):
+        """
+        Return a prepared circular avatar, fetching it on a cache miss. None if unavailable.
+        """
+        key = (asset.key, size)
+        if key in self.avatars:
+            self.avatars.move_to_end(key)
+            return self.avatars[key]
+
+        # Members sharing an avatar (e.g. default avatars) in one collage share the download
+        if key not in self.fetching:
+            self.fetching[key] = asyncio.create_task(self.fetch_avatar(asset, size))
+        return await asyncio.shield(self.fetching[key])
+
+    async def fetch_avatar(self, asset, size):
+        try:
+            async with self.fetch_semaphore:
+                data = await self.bot.http.get_from_cdn(asset.with_static_format("png").with_size(256).url)
+            loop = asyncio.get_running_loop()
+            avatar = await loop.run_in_executor(self.executor, prepare_avatar, data, size)
+        except Exception as e:
+            print(f"Could not fetch avatar {asset.key}: {e}")
+            return None
+        finally:
+            self.fetching.pop((asset.key, size), None)
+
+        self.cache_avatar((asset.key, size), avatar)
+        return avatar
+
+    def cache_avatar(self, key, avatar):
+        self.avatars[key] = avatar
+        self.avatars.move_to_end(key)
+        if len(self.avatars) > WELCOME_CARD_CACHE_SIZE:
+            self.avatars.popitem(last=False)
+
+    def background(self):
+        """
+        Return the card template, loading it once per distinct file content.
+        Runs in the thread pool.
+        """
+        with self.background_lock:
+            if not WELCOME_CARD_BACKGROUND:
+                if "default" not in self.backgrounds:
+                    self.backgrounds["default"] = self.default_background()
+                return self.backgrounds["default"]
+
+            stat = os.stat(WELCOME_CARD_BACKGROUND)
+            source = (WELCOME_CARD_BACKGROUND, stat.st_mtime_ns, stat.st_size)
+            if source not in self.background_hashes:
+                with open(WELCOME_CARD_BACKGROUND, "rb") as template_file:
+                    data = template_file.read()
+                digest = hashlib.sha256(data).hexdigest()
+                if digest not in self.backgrounds:
+                    template = Image.open(io.BytesIO(data)).convert("RGBA")
+                    self.backgrounds[digest] = ImageOps.fit(template, CARD_SIZE)
+                self.background_hashes[source] = digest
+            return self.backgrounds[self.background_hashes[source]]
+
+    @staticmethod
+    def default_background():
+        """Dark green gradient matching the bot's embed color."""
+        gradient = Image.linear_gradient("L").rotate(90).resize(CARD_SIZE)
+        dark = Image.new("RGBA", CARD_SIZE, (24, 26, 31, 255))
+        accent = Image.new("RGBA", CARD_SIZE, (25, 105, 55, 255))
+        return Image.composite(accent, dark, gradient)
+
+    # Rendering (thread pool)
+
+    def placeholder_avatar(self, size):
+        avatar = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+        ImageDraw.Draw(avatar).ellipse((0, 0, size - 1, size - 1), fill=(88, 101, 242, 255))
+        return avatar
+
+    def render_card(self, name, member_count, avatar):
+        card = self.background().copy()
+        draw = ImageDraw.Draw(card)
+        avatar = avatar or self.placeholder_avatar(AVATAR_SIZE)
+        top = (CARD_SIZE[1] - AVATAR_SIZE) // 2
+        draw.ellipse((50, top - 10, 70 + AVATAR_SIZE, top + AVATAR_SIZE + 10), fill=(51, 210, 109, 255))
+        card.alpha_composite(avatar, (60, top))
+
+        left = 60 + AVATAR_SIZE + 50
+        max_width = CARD_SIZE[0] - left - 40
+        draw.text((left, 80), "WELCOME", font=_font(40), fill=(51, 210, 109, 255))
+        text, font = _fit_text(draw, name, 72, max_width)
+        draw.text((left, 135), text, font=font, fill=(255, 255, 255, 255))
+        draw.text((left, 240), f"Member #{member_count}", font=_font(32), fill=(185, 187, 190, 255))
+        return self.encode(card)
+
+    def render_collage(self, count, member_count, avatars):
+        card = self.background().copy()
+        draw = ImageDraw.Draw(card)
+        draw.text((60, 24), f"Welcome to our {count} new members!", font=_font(48), fill=(255, 255, 255, 255))
+
+        gap = 12
+        per_row = COLLAGE_MAX_AVATARS // 2
+        for index, avatar in enumerate(avatars):
+            row, column = divmod(index, per_row)
+            position = (60 + column * (COLLAGE_AVATAR_SIZE + gap), 96 + row * (COLLAGE_AVATAR_SIZE + gap))
+            card.alpha_composite(avatar or self.placeholder_avatar(COLLAGE_AVATAR_SIZE), position)
+
+        footer = f"We're now {member_count} members"
+        if count > len(avatars):
+            footer = f"+{count - len(avatars)} more · {footer}"
+        draw.text((60, CARD_SIZE[1] - 20), footer, font=_font(24), fill=(185, 187, 190, 255), anchor="ls")
+        return self.encode(card)
+
+    @staticmethod
+    def encode(card):
+        output = io.BytesIO()
+        # JPEG encodes ~5x faster than PNG at a similar size; no chroma subsampling keeps text sharp
+        card.convert("RGB").save(output, "JPEG", quality=90, subsampling=0)
+        return output.getvalue()
+
+async def _benchmark(count):
+    """
+    Render `count` cards from 50 distinct avatars and one collage, without Discord.
+    """
+    renderer = WelcomeCardRenderer(None)
+    loop = asyncio.get_running_loop()
+    sources = []
+    for i in range(50):
+        output = io.BytesIO()
+        Image.new("RGB", (256, 256), (i * 5, 120, 255 - i * 5)).save(output, "PNG")
+        sources.append(output.getvalue())
+
+    async def card(i):
+        key = (str(i % len(sources)), AVATAR_SIZE)
+        if key not in renderer.avatars:
+            renderer.cache_avatar(key, await loop.run_in_executor(renderer.executor, prepare_avatar, sources[i % len(sources)], AVATAR_SIZE))
+        return await loop.run_in_executor(renderer.executor, renderer.render_card, f"member{i}", 1000 + i, renderer.avatars[key])
+
+    await card(0)  # Load fonts and the background template
+    started = time.perf_counter()
+    images = await asyncio.gather(*(card(i) for i in range(count)))
+    elapsed = time.perf_counter() - started
+    print(f"cards: {count} in {elapsed:.2f}s = {count / elapsed:.0f} cards/s with {WELCOME_CARD_WORKERS} threads, {len(images[0]) / 1024:.0f} KiB each")
+
+    avatars = [await loop.run_in_executor(renderer.executor, prepare_avatar, data, COLLAGE_AVATAR_SIZE) for data in sources[:COLLAGE_MAX_AVATARS]]
+    started = time.perf_counter()
+    await loop.run_in_executor(renderer.executor, renderer.render_collage, count, 1000 + count, avatars)
+    print(f"collage: {count} members in one card in {(time.perf_counter() - started) * 1000:.0f}ms")
+    await renderer.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark welcome card rendering.")
+    parser.add_argument("--benchmark", type=int, default=500, metavar="CARDS")
+    if not cards_available():
+        raise SystemExit("Pillow is not installed")
+    asyncio.run(_benchmark(parser.parse_args().benchmark))
@@ -0,0 +1,87 @@
+import collections
+import json
+import os
+import time
+
+class RecentlyWelcomed:
+    """
+    Size-capped LRU of recently welcomed members with a TTL.
+    Lookups, inserts and expiry are O(1) per join; memory is bounded by max_entries.
+    `clock` returns the current time in seconds since the epoch.
+    """
+
+    def __init__(self, window, max_entries, clock=time.time):
+        self.window = window
+        self.max_entries = max_entries
+        self.clock = clock
+        self.entries = collections.OrderedDict()  # {(guild_id, user_id): welcomed_at}, oldest first
+        self.suppressed = 0
+        self.evicted = 0
+        self.dirty = False
+
+    def expire(self, now):
+        """
+        Drop entries older than the window; they're ordered by welcome time.
+        """
+        while self.entries:
+            key, welcomed_at = next(iter(self.entries.items()))
+            if now - welcomed_at < self.window:
+                break
+            del self.entries[key]
+            self.dirty = True
+
+    def seen(self, guild_id, user_id, now=None):
+        """
+        Return True if the member was welcomed within the window, otherwise record them.
+        Suppressed joins don't refresh the entry, so a join/leave loop is greeted once per window.
+        """
+        now = self.clock() if now is None else now
+        self.expire(now)
+
+        key = (guild_id, user_id)
+        if key in self.entries:
+            self.suppressed += 1
+            return True
+
+        self.entries[key] = now
+        self.dirty = True
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evicted += 1
+        return False
+
+    def load(self, path):
+        """
+        Restore entries saved by save(), skipping those already expired.
+        """
+        try:
+            with open(path, "r", encoding="utf-8") as state_file:
+                rows = json.load(state_file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Could not load welcome history from {path}: {e}")
+            return
+
+        now = self.clock()
+        for guild_id, user_id, welcomed_at in sorted(rows, key=lambda row: row[2])[-self.max_entries:]:
+            if now - welcomed_at < self.window:
+                self.entries[(guild_id, user_id)] = welcomed_at
+        print(f"Loaded {len(self.entries)} recently welcomed members")
+
+    def snapshot(self):
+        """
+        Return the entries as JSON-ready rows and clear the dirty flag.
+        """
+        self.dirty = False
+        return [[guild_id, user_id, welcomed_at] for (guild_id, user_id), welcomed_at in self.entries.items()]
+
+    @staticmethod
+    def save(path, rows):
+        """
+        Atomically write rows from snapshot(); safe to run in a thread.
+        """
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as state_file:
+            json.dump(rows, state_file, separators=(",", ":"))
+        os.replace(temp_path, path)